@@ -0,0 +1,308 @@
+import numpy as np
+import polars as pl
+
+ASSIGN_BULK_ROUND_SHARE = 16
+
+def node_rows(ids: np.ndarray, count: int):
+    # row positions grouped per node, keeping the (rank, tie-break) order of the rows
+    order = np.argsort(ids, kind="stable")
+    start = np.zeros(count + 1, dtype=np.int64)
+    np.cumsum(np.bincount(ids, minlength=count), out=start[1:])
+    return order.tolist(), start.tolist()
+
+def first_per_node(rows: np.ndarray, ids: np.ndarray, count: int) -> np.ndarray:
+    # the smallest row position per node is its best ranked row
+    first = np.full(count, len(ids))
+    np.minimum.at(first, ids[rows], rows)
+    return first[first < len(ids)]
+
+def mutual_best_rows(left: np.ndarray, right: np.ndarray, rank: np.ndarray, tie_break: bool = True) -> list[int]:
+    # replays the rounds of "keep pairs ranked best on both sides, drop their ends, repeat";
+    # rows are sorted by (rank, tie-break) so the smaller row position wins a tie
+    counts = (int(left.max(initial=-1)) + 1, int(right.max(initial=-1)) + 1)
+    used = (np.zeros(counts[0], dtype=bool), np.zeros(counts[1], dtype=bool))
+    chosen_rows = []
+
+    # whole rounds at once while they settle a good share of the rows
+    while True:
+        alive = np.flatnonzero(~used[0][left] & ~used[1][right])
+        best = np.full(counts[0], -1), np.full(counts[1], -1)
+        for s, ids in enumerate((left, right)):
+            top = first_per_node(alive, ids, counts[s])
+            best[s][ids[top]] = rank[top]
+        cand = alive[(rank[alive] == best[0][left[alive]]) & (rank[alive] == best[1][right[alive]])]
+        if len(alive) > ASSIGN_BULK_ROUND_SHARE * len(cand) or not len(cand):
+            break
+        if tie_break:
+            chosen = first_per_node(first_per_node(cand, left, counts[0]), right, counts[1])
+        else:
+            chosen = cand[
+                (np.bincount(left[cand], minlength=counts[0])[left[cand]] == 1) &
+                (np.bincount(right[cand], minlength=counts[1])[right[cand]] == 1)
+            ]
+        if not len(chosen):
+            return chosen_rows
+        chosen_rows.extend(chosen.tolist())
+        used[0][left[chosen]] = used[1][right[chosen]] = True
+
+    # then one node at a time: a pair stays a candidate until one of its ends is used,
+    # so only neighbours of newly used ends have to be looked at again
+    ends = (left.tolist(), right.tolist())
+    rows = (node_rows(left, counts[0]), node_rows(right, counts[1]))
+    ptr = (rows[0][1][:-1], rows[1][1][:-1])
+    rank = rank.tolist()
+    used = (used[0].tolist(), used[1].tolist())
+
+    cands: tuple[dict[int, set[int]], dict[int, set[int]]] = ({}, {})
+    for r in cand.tolist():
+        cands[0].setdefault(ends[0][r], set()).add(r)
+        cands[1].setdefault(ends[1][r], set()).add(r)
+
+    def top_rank(s: int, x: int):
+        order, start = rows[s]
+        other, other_used = ends[1 - s], used[1 - s]
+        p, end = ptr[s][x], start[x + 1]
+        while p < end and other_used[other[order[p]]]:
+            p += 1
+        ptr[s][x] = p
+        return rank[order[p]] if p < end else None
+
+    touched = (list(cands[0]), list(cands[1]))
+    while True:
+        if tie_break:
+            picks: dict[int, int] = {}
+            for rs in cands[0].values():
+                r = min(rs)
+                if picks.get(ends[1][r], r) >= r:
+                    picks[ends[1][r]] = r
+            chosen = list(picks.values())
+        else:
+            chosen = list({
+                r
+                for s in (0, 1) for x in touched[s] for r in cands[s].get(x, ())
+                if len(cands[0][ends[0][r]]) == 1 and len(cands[1][ends[1][r]]) == 1
+            })
+        if not chosen:
+            return chosen_rows
+        chosen_rows.extend(chosen)
+
+        for r in chosen:
+            used[0][ends[0][r]] = used[1][ends[1][r]] = True
+        dirty = (set(), set())
+        for r in chosen:
+            for s in (0, 1):
+                x = ends[s][r]
+                for r2 in cands[s].pop(x, ()):
+                    y = ends[1 - s][r2]
+                    if y in cands[1 - s]:
+                        cands[1 - s][y].discard(r2)
+                        if not cands[1 - s][y]:
+                            del cands[1 - s][y]
+                order, start = rows[s]
+                for p in range(ptr[s][x], start[x + 1]):
+                    y = ends[1 - s][order[p]]
+                    if not used[1 - s][y]:
+                        dirty[1 - s].add(y)
+
+        for s in (0, 1):
+            order, start = rows[s]
+            for x in dirty[s]:
+                t = top_rank(s, x)
+                p, end = ptr[s][x], start[x + 1]
+                while p < end and rank[order[p]] == t:
+                    r = order[p]
+                    y = ends[1 - s][r]
+                    if not used[1 - s][y] and top_rank(1 - s, y) == t:
+                        cands[0].setdefault(ends[0][r], set()).add(r)
+                        cands[1].setdefault(ends[1][r], set()).add(r)
+                    p += 1
+        touched = dirty
+
+def connected_components(left: list, right: list) -> list[int]:
+    # component label per pair; pairs sharing an end on either side share a label
+    parent = list(range(len(left)))
+    def find(x: int):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+    first: tuple[dict, dict] = ({}, {})
+    for r in range(len(left)):
+        for s, x in ((0, left[r]), (1, right[r])):
+            if x in first[s]:
+                parent[find(r)] = find(first[s][x])
+            else:
+                first[s][x] = r
+    return [find(r) for r in range(len(left))]
+
+def assign_pairs(match_df: pl.DataFrame, score: str | pl.Expr,
+                 left: str = "old_fid", right: str = "new_fid",
+                 tie_break: list[str] | None = None) -> pl.DataFrame:
+    # one-to-one rows of match_df, higher score first; without tie_break, ends tied on their
+    # best score are left unassigned (the is_unique rule), with it the first pair in that order wins
+    score = pl.col(score) if isinstance(score, str) else score
+    df = (
+        match_df
+        .with_row_index("_row")
+        .with_columns(score.rank("dense", descending=True).cast(pl.Int64).alias("_rank"))
+        .filter(pl.col("_rank").is_not_null())
+        .sort("_rank", *(tie_break or []), "_row")
+        .with_columns(
+            (pl.col(left).rank("dense").cast(pl.Int64) - 1).alias("_left"),
+            (pl.col(right).rank("dense").cast(pl.Int64) - 1).alias("_right"),
+        )
+    )
+    rows = mutual_best_rows(
+        df["_left"].to_numpy(), df["_right"].to_numpy(), df["_rank"].to_numpy(),
+        tie_break=tie_break is not None,
+    )
+    return (
+        df[sorted(rows)]
+        .sort("_row")
+        .drop("_row", "_rank", "_left", "_right")
+    )
+
+class StagedUniqueSelector:
+    # one round of chained "best on both sides" filters, one score after another, then the
+    # pairs whose ends are left unique; the per-stage sets survive between rounds so a round
+    # only looks at nodes around rows that changed since the previous one.
+    # a row takes part while neither end is used; with fixed scores rows can only drop out, so
+    # each node walks its rows in score order, otherwise scores are counts that grow from zero
+    # and the rows with a positive count are tracked as they come and go
+    def __init__(self, left: list[int], right: list[int], used: tuple[list[bool], list[bool]],
+                 scores: list[list], fixed_scores: bool):
+        self.ends = (left, right)
+        self.used = used
+        self.counts = (len(used[0]), len(used[1]))
+        self.scores = scores
+        self.fixed_scores = fixed_scores
+        self.node_order: list[tuple[list[int], list[int]]] = []
+        self.ptr: list[list[int]] = []
+        self.present_rows: tuple[dict[int, set[int]], dict[int, set[int]]] = ({}, {})
+        self.stages: list[set[int]] = []
+        self.stage_rows: list[tuple[dict[int, set[int]], dict[int, set[int]]]] = []
+        self.best: list[tuple[list, list]] = []
+        self.pending: set[int] = set()
+
+    def present(self, r: int):
+        return (
+            not self.used[0][self.ends[0][r]] and not self.used[1][self.ends[1][r]]
+            and (self.fixed_scores or self.scores[0][r] > 0)
+        )
+
+    def touch(self, rows):
+        self.pending.update(rows)
+
+    def toggle(self, stage: set[int], stage_rows: tuple[dict, dict], r: int):
+        if r in stage:
+            stage.discard(r)
+            for s in (0, 1):
+                rows = stage_rows[s][self.ends[s][r]]
+                rows.discard(r)
+                if not rows:
+                    del stage_rows[s][self.ends[s][r]]
+        else:
+            stage.add(r)
+            for s in (0, 1):
+                stage_rows[s].setdefault(self.ends[s][r], set()).add(r)
+
+    def build(self):
+        # the first round filters every row at once
+        ends = [np.asarray(end, dtype=np.int64) for end in self.ends]
+        first = np.asarray(self.scores[0], dtype=np.float64)
+        mask = ~np.asarray(self.used[0], dtype=bool)[ends[0]] & ~np.asarray(self.used[1], dtype=bool)[ends[1]]
+        if self.fixed_scores:
+            for s in (0, 1):
+                order = np.lexsort((-first, ends[s]))
+                start = np.zeros(self.counts[s] + 1, dtype=np.int64)
+                np.cumsum(np.bincount(ends[s], minlength=self.counts[s]), out=start[1:])
+                self.node_order.append((order.tolist(), start.tolist()))
+                self.ptr.append(start[:-1].tolist())
+        else:
+            mask &= first > 0
+            for r in np.flatnonzero(mask).tolist():
+                for s in (0, 1):
+                    self.present_rows[s].setdefault(self.ends[s][r], set()).add(r)
+
+        for score in self.scores:
+            values = np.asarray(score, dtype=np.float64)
+            best = []
+            for s in (0, 1):
+                best.append(np.full(self.counts[s], -np.inf))
+                np.maximum.at(best[s], ends[s][mask], values[mask])
+            mask &= (values == best[0][ends[0]]) & (values == best[1][ends[1]])
+            self.best.append((best[0].tolist(), best[1].tolist()))
+            self.stages.append(set())
+            self.stage_rows.append(({}, {}))
+            for r in np.flatnonzero(mask).tolist():
+                self.toggle(self.stages[-1], self.stage_rows[-1], r)
+        self.pending.clear()
+        return self.stage_rows[-1][0].keys(), self.stage_rows[-1][1].keys()
+
+    def top_rows(self, s: int, x: int):
+        # present rows of a node that can reach its best first score
+        if not self.fixed_scores:
+            return self.present_rows[s].get(x, ())
+        order, start = self.node_order[s]
+        score, other_used, other = self.scores[0], self.used[1 - s], self.ends[1 - s]
+        if self.used[s][x]:
+            return []
+        p, end = self.ptr[s][x], start[x + 1]
+        while p < end and other_used[other[order[p]]]:
+            p += 1
+        self.ptr[s][x] = p
+        rows = []
+        while p < end and score[order[p]] == score[order[self.ptr[s][x]]]:
+            if not other_used[other[order[p]]]:
+                rows.append(order[p])
+            p += 1
+        return rows
+
+    def select(self) -> list[int]:
+        ends = self.ends
+        if not self.stages:
+            dirty = self.build()
+        else:
+            changed, self.pending = self.pending, set()
+            if not self.fixed_scores:
+                present_rows, present = self.present_rows, self.present
+                for r in changed:
+                    now = present(r)
+                    if now != (r in present_rows[0].get(ends[0][r], ())):
+                        for s in (0, 1):
+                            rows = present_rows[s].setdefault(ends[s][r], set())
+                            if now:
+                                rows.add(r)
+                            else:
+                                rows.discard(r)
+            dirty = ({ends[0][r] for r in changed}, {ends[1][r] for r in changed})
+            for i, score in enumerate(self.scores):
+                best, stage, stage_rows = self.best[i], self.stages[i], self.stage_rows[i]
+                # every row of the dirty nodes that passed the filters before this one
+                check, prev = set(), set()
+                for s in (0, 1):
+                    for x in dirty[s]:
+                        rows = self.stage_rows[i - 1][s].get(x, ()) if i else self.top_rows(s, x)
+                        best[s][x] = max((score[r] for r in rows), default=-np.inf)
+                        prev.update(rows)
+                        check.update(stage_rows[s].get(x, ()))
+                check |= prev
+                next_dirty = (set(), set())
+                for r in check:
+                    keep = r in prev and score[r] == best[0][ends[0][r]] and score[r] == best[1][ends[1][r]]
+                    if keep != (r in stage):
+                        self.toggle(stage, stage_rows, r)
+                        next_dirty[0].add(ends[0][r])
+                        next_dirty[1].add(ends[1][r])
+                # later filters also see rows whose scores changed without changing this stage
+                for r in changed & stage:
+                    next_dirty[0].add(ends[0][r])
+                    next_dirty[1].add(ends[1][r])
+                dirty = next_dirty
+
+        last_rows = self.stage_rows[-1]
+        return list({
+            r
+            for s in (0, 1) for x in dirty[s] for r in last_rows[s].get(x, ())
+            if len(last_rows[0][ends[0][r]]) == 1 and len(last_rows[1][ends[1][r]]) == 1
+        })
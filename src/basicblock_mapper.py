@@ -1,35 +1,52 @@
+import sys
+import numpy as np
 import polars as pl
-
-def join_edge(self: str, other: str, 
-              bb_match_df: pl.DataFrame, bb_map_df: pl.DataFrame, 
-              old_edge_df: pl.DataFrame, new_edge_df: pl.DataFrame) -> pl.DataFrame:
-    match_edge_df = (
-        bb_match_df
-        .join(
-            bb_map_df
-            .join(
-                old_edge_df.rename({
-                    f"{other}_fid": f"{other}_old_fid", 
-                    f"{other}_bid": f"{other}_old_bid"
-                }), 
-                left_on=["old_fid", "old_bid"], 
-                right_on=[f"{self}_fid", f"{self}_bid"],
-            )
-            .join(
-                new_edge_df.rename({
-                    f"{other}_fid": f"{other}_new_fid", 
-                    f"{other}_bid": f"{other}_new_bid"
-                }), 
-                left_on=["new_fid", "new_bid"], 
-                right_on=[f"{self}_fid", f"{self}_bid"],
-            ), 
-            left_on=["old_fid", "old_bid", "new_fid", "new_bid"],
-            right_on=[f"{other}_old_fid", f"{other}_old_bid", f"{other}_new_fid", f"{other}_new_bid"],
-        )
-        .group_by("old_fid", "old_bid", "new_fid", "new_bid")
-        .len()
+from assignment import StagedUniqueSelector
+
+def block_index(*block_dfs: pl.DataFrame) -> pl.DataFrame:
+    # blocks sorted by function, so the blocks of a function take a contiguous index range
+    return pl.concat(block_dfs).unique().sort("fid", "bid").with_row_index("idx")
+
+def edge_csr(edge_df: pl.DataFrame, block_df: pl.DataFrame, count: int):
+    # successors and predecessors of every block as offset and neighbour arrays
+    edge_df = (
+        edge_df
+        .join(block_df.rename({"fid": "src_fid", "bid": "src_bid", "idx": "src"}), on=["src_fid", "src_bid"])
+        .join(block_df.rename({"fid": "dst_fid", "bid": "dst_bid", "idx": "dst"}), on=["dst_fid", "dst_bid"])
+    )
+    adjacency = []
+    for s, o in [("src", "dst"), ("dst", "src")]:
+        edge_df = edge_df.sort(s, o)
+        offsets = np.zeros(count + 1, dtype=np.int64)
+        np.cumsum(np.bincount(edge_df[s].to_numpy(), minlength=count), out=offsets[1:])
+        adjacency.append((offsets.tolist(), edge_df[o].to_list()))
+    return adjacency
+
+def select_hot_blocks(node_df: pl.DataFrame, edge_df: pl.DataFrame) -> pl.DataFrame:
+    # sampled blocks plus their CFG neighbours, which edge propagation maps them through
+    hot_df = node_df.filter(pl.col("count") > 0).select("fid", "bid")
+    return pl.concat([
+        hot_df,
+        edge_df
+        .join(hot_df, left_on=["src_fid", "src_bid"], right_on=["fid", "bid"])
+        .select(pl.col("dst_fid").alias("fid"), pl.col("dst_bid").alias("bid")),
+        edge_df
+        .join(hot_df, left_on=["dst_fid", "dst_bid"], right_on=["fid", "bid"])
+        .select(pl.col("src_fid").alias("fid"), pl.col("src_bid").alias("bid")),
+    ]).unique()
+
+def report_coverage(node_df: pl.DataFrame, bb_map_df: pl.DataFrame):
+    sample_df = node_df.filter(pl.col("count") > 0)
+    mapped_df = sample_df.join(
+        bb_map_df.select(pl.col("old_fid").alias("fid"), pl.col("old_bid").alias("bid")), 
+        on=["fid", "bid"], how="semi",
+    )
+    samples, mapped_samples = sample_df["count"].sum(), mapped_df["count"].sum()
+    print(
+        f"mapped {mapped_samples} of {samples} samples ({mapped_samples / max(samples, 1):.1%}) "
+        f"in {mapped_df.height} of {sample_df.height} sampled blocks",
+        file=sys.stderr,
     )
-    return match_edge_df
 
 def map_bb(old_node_df: pl.DataFrame, new_node_df: pl.DataFrame,
            old_edge_df: pl.DataFrame, new_edge_df: pl.DataFrame,
@@ -42,10 +59,6 @@ def map_bb(old_node_df: pl.DataFrame, new_node_df: pl.DataFrame,
                     "jump_diff_score", "operand_match_score").round(6))
     )
 
-    # bb_map_df = pl.DataFrame(
-    #     schema=bb_match_df.select("old_fid", "old_bid", "new_fid", "new_bid").schema
-    # )
-
     bb_map_df = (
         func_map_df
         .join(old_node_df, left_on="old_fid", right_on="fid")
@@ -54,172 +67,98 @@ def map_bb(old_node_df: pl.DataFrame, new_node_df: pl.DataFrame,
         .unique()
         .filter(pl.struct("old_fid", "old_bid").is_unique() & pl.struct("new_fid", "new_bid").is_unique())
     )
-    bb_match_df = (
-        bb_match_df
-        .join(bb_map_df, on=["old_fid", "old_bid"], how="anti")
-        .join(bb_map_df, on=["new_fid", "new_bid"], how="anti")
+
+    old_block_df = block_index(
+        old_node_df.select("fid", "bid"), 
+        bb_match_df.select(pl.col("old_fid").alias("fid"), pl.col("old_bid").alias("bid")),
+    )
+    new_block_df = block_index(
+        new_node_df.select("fid", "bid"), 
+        bb_match_df.select(pl.col("new_fid").alias("fid"), pl.col("new_bid").alias("bid")),
+    )
+    old_index_df = old_block_df.rename(lambda col: "old_" + col)
+    new_index_df = new_block_df.rename(lambda col: "new_" + col)
+    bb_match_df = bb_match_df.join(old_index_df, on=["old_fid", "old_bid"]).join(new_index_df, on=["new_fid", "new_bid"])
+    bb_map_df = bb_map_df.join(old_index_df, on=["old_fid", "old_bid"]).join(new_index_df, on=["new_fid", "new_bid"])
+
+    old_succ, old_pred = edge_csr(old_edge_df, old_block_df, old_block_df.height)
+    new_succ, new_pred = edge_csr(new_edge_df, new_block_df, new_block_df.height)
+
+    left, right = bb_match_df["old_idx"].to_list(), bb_match_df["new_idx"].to_list()
+    match_row = {pair: r for r, pair in enumerate(zip(left, right))}
+    old_rows: list[list[int]] = [[] for _ in range(old_block_df.height)]
+    new_rows: list[list[int]] = [[] for _ in range(new_block_df.height)]
+    for r, (o, n) in enumerate(zip(left, right)):
+        old_rows[o].append(r)
+        new_rows[n].append(r)
+
+    # mapped neighbour pairs of each candidate: through predecessors, successors and both
+    pred_len, succ_len, edge_len = [0] * len(left), [0] * len(left), [0] * len(left)
+    old_used, new_used = [False] * old_block_df.height, [False] * new_block_df.height
+    used = (old_used, new_used)
+
+    jump_func, opcode_match, jump_diff, operand_match = (
+        bb_match_df[col].to_list() 
+        for col in ["jump_func_score", "opcode_match_score", "jump_diff_score", "operand_match_score"]
+    )
+    by_score = StagedUniqueSelector(left, right, used, [jump_func, opcode_match], True)
+    by_pred = StagedUniqueSelector(left, right, used, [pred_len], False)
+    by_succ = StagedUniqueSelector(left, right, used, [succ_len], False)
+    by_edge = StagedUniqueSelector(left, right, used, [edge_len], False)
+    by_all_scores = StagedUniqueSelector(
+        left, right, used, [jump_func, opcode_match, jump_diff, operand_match], True
     )
 
-    iter_count = 0
+    mapped: list[tuple[int, int]] = []
+    def add(pairs: list[tuple[int, int]]):
+        # only candidates around the newly mapped blocks change, the selectors revisit just those
+        changed = set()
+        for o, n in pairs:
+            old_used[o] = new_used[n] = True
+            changed.update(old_rows[o])
+            changed.update(new_rows[n])
+        for o, n in pairs:
+            for (old_offsets, old_adj), (new_offsets, new_adj), lens in [
+                (old_succ, new_succ, pred_len), (old_pred, new_pred, succ_len)
+            ]:
+                for ob in old_adj[old_offsets[o]:old_offsets[o + 1]]:
+                    for nb in new_adj[new_offsets[n]:new_offsets[n + 1]]:
+                        r = match_row.get((ob, nb))
+                        if r is not None:
+                            lens[r] += 1
+                            edge_len[r] += 1
+                            changed.add(r)
+        for selector in (by_score, by_pred, by_succ, by_edge, by_all_scores):
+            selector.touch(changed)
+        mapped.extend(pairs)
+
+    def rows_pairs(rows: list[int]):
+        return [(left[r], right[r]) for r in rows]
+
+    add(list(zip(bb_map_df["old_idx"].to_list(), bb_map_df["new_idx"].to_list())))
     while True:
-        # print(iter_count, bb_match_df.shape[0], end="\r")
-        iter_count += 1
-
-        assert type(bb_match_df) == pl.DataFrame
-        temp_map_df = (
-            bb_match_df
-            .filter(
-                pl.col("jump_func_score").max().over("old_fid", "old_bid")
-                .eq(pl.col("jump_func_score")) &
-                pl.col("jump_func_score").max().over("new_fid", "new_bid")
-                .eq(pl.col("jump_func_score"))
-            )
-            .filter(
-                pl.col("opcode_match_score").max().over("old_fid", "old_bid")
-                .eq(pl.col("opcode_match_score")) &
-                pl.col("opcode_match_score").max().over("new_fid", "new_bid")
-                .eq(pl.col("opcode_match_score"))
-            )
-            .filter(
-                pl.struct("old_fid", "old_bid").is_unique() &
-                pl.struct("new_fid", "new_bid").is_unique()
-            )
-            .select(bb_map_df.columns)
-        )
-
-        if not temp_map_df.is_empty():
-            bb_map_df.vstack(temp_map_df, in_place=True)
-            bb_match_df = (
-                bb_match_df
-                .join(temp_map_df, on=["old_fid", "old_bid"], how="anti")
-                .join(temp_map_df, on=["new_fid", "new_bid"], how="anti")
-            )
+        if chosen := by_score.select():
+            add(rows_pairs(chosen))
             continue
 
-        match_edge1_df: pl.DataFrame = join_edge(
-            "src", "dst", bb_match_df, bb_map_df, old_edge_df, new_edge_df,
-        )
-        temp_map1_df = (
-            match_edge1_df
-            .filter(
-                pl.col("len").max().over("old_fid", "old_bid")
-                .eq(pl.col("len")) &
-                pl.col("len").max().over("new_fid", "new_bid")
-                .eq(pl.col("len"))
-            )
-            .filter(
-                pl.struct("old_fid", "old_bid").is_unique() &
-                pl.struct("new_fid", "new_bid").is_unique()
-            )
-            .select(bb_map_df.columns)
-        )
-
-        bb_map_df.vstack(temp_map1_df, in_place=True)
-        bb_match_df = (
-            bb_match_df
-            .join(temp_map1_df, on=["old_fid", "old_bid"], how="anti")
-            .join(temp_map1_df, on=["new_fid", "new_bid"], how="anti")
-        )
-
-        match_edge2_df: pl.DataFrame = join_edge(
-            "dst", "src", bb_match_df, bb_map_df, old_edge_df, new_edge_df,
-        )
-        temp_map2_df = (
-            match_edge2_df
-            .filter(
-                pl.col("len").max().over("old_fid", "old_bid")
-                .eq(pl.col("len")) &
-                pl.col("len").max().over("new_fid", "new_bid")
-                .eq(pl.col("len"))
-            )
-            .filter(
-                pl.struct("old_fid", "old_bid").is_unique() &
-                pl.struct("new_fid", "new_bid").is_unique()
-            )
-            .select(bb_map_df.columns)
-        )
-
-        bb_map_df.vstack(temp_map2_df, in_place=True)
-        bb_match_df = (
-            bb_match_df
-            .join(temp_map2_df, on=["old_fid", "old_bid"], how="anti")
-            .join(temp_map2_df, on=["new_fid", "new_bid"], how="anti")
-        )
-
-        if not temp_map1_df.is_empty() or not temp_map2_df.is_empty():
+        # blocks entered from mapped predecessors, then left towards mapped successors
+        chosen_pred = by_pred.select()
+        add(rows_pairs(chosen_pred))
+        chosen_succ = by_succ.select()
+        add(rows_pairs(chosen_succ))
+        if chosen_pred or chosen_succ:
             continue
 
-        match_edge_df = (
-            pl.concat([match_edge1_df, match_edge2_df])
-            .group_by("old_fid", "old_bid", "new_fid", "new_bid")
-            .sum()
-        )
-
-        temp_map_df = (
-            match_edge_df
-            .filter(
-                pl.col("len").max().over("old_fid", "old_bid")
-                .eq(pl.col("len")) &
-                pl.col("len").max().over("new_fid", "new_bid")
-                .eq(pl.col("len"))
-            )
-            .filter(
-                pl.struct("old_fid", "old_bid").is_unique() &
-                pl.struct("new_fid", "new_bid").is_unique()
-            )
-            .select(bb_map_df.columns)
-        )
-
-        if not temp_map_df.is_empty():
-            bb_map_df.vstack(temp_map_df, in_place=True)
-            bb_match_df = (
-                bb_match_df
-                .join(temp_map_df, on=["old_fid", "old_bid"], how="anti")
-                .join(temp_map_df, on=["new_fid", "new_bid"], how="anti")
-            )
+        if chosen := by_edge.select():
+            add(rows_pairs(chosen))
             continue
-        
-        temp_map_df = (
-            bb_match_df
-            .filter(
-                pl.col("jump_func_score").max().over("old_fid", "old_bid")
-                .eq(pl.col("jump_func_score")) &
-                pl.col("jump_func_score").max().over("new_fid", "new_bid")
-                .eq(pl.col("jump_func_score"))
-            )
-            .filter(
-                pl.col("opcode_match_score").max().over("old_fid", "old_bid")
-                .eq(pl.col("opcode_match_score")) &
-                pl.col("opcode_match_score").max().over("new_fid", "new_bid")
-                .eq(pl.col("opcode_match_score"))
-            )
-            .filter(
-                pl.col("jump_diff_score").max().over("old_fid", "old_bid")
-                .eq(pl.col("jump_diff_score")) &
-                pl.col("jump_diff_score").max().over("new_fid", "new_bid")
-                .eq(pl.col("jump_diff_score"))
-            )
-            .filter(
-                pl.col("operand_match_score").max().over("old_fid", "old_bid")
-                .eq(pl.col("operand_match_score")) &
-                pl.col("operand_match_score").max().over("new_fid", "new_bid")
-                .eq(pl.col("operand_match_score"))
-            )
-            .filter(
-                pl.struct("old_fid", "old_bid").is_unique() &
-                pl.struct("new_fid", "new_bid").is_unique()
-            )
-            .select(bb_map_df.columns)
-        )
-        
-        if temp_map_df.is_empty():
-            break
 
-        bb_map_df.vstack(temp_map_df, in_place=True)
-        bb_match_df = (
-            bb_match_df
-            .join(temp_map_df, on=["old_fid", "old_bid"], how="anti")
-            .join(temp_map_df, on=["new_fid", "new_bid"], how="anti")
-        )
+        if not (chosen := by_all_scores.select()):
+            break
+        add(rows_pairs(chosen))
 
-    return bb_map_df
+    old_idx, new_idx = zip(*mapped) if mapped else ((), ())
+    return pl.concat([
+        old_block_df[list(old_idx)].select(pl.col("fid").alias("old_fid"), pl.col("bid").alias("old_bid")),
+        new_block_df[list(new_idx)].select(pl.col("fid").alias("new_fid"), pl.col("bid").alias("new_bid")),
+    ], how="horizontal")
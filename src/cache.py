@@ -0,0 +1,118 @@
+import hashlib
+import json
+import os
+import polars as pl
+
+CACHE_MAX_BYTES = 32 * 1024**3
+# bump whenever read_log, read_ins or read_src_pack change what they produce
+CACHE_VERSION = 1
+
+def digest_files(paths, cache_dir: str | None = None) -> list[str]:
+    # content digests, memoized per (size, mtime) so unchanged multi-GB inputs are hashed once
+    memo_path = os.path.join(cache_dir, "digests.json") if cache_dir else None
+    memo = {}
+    if memo_path:
+        os.makedirs(cache_dir, exist_ok=True)
+    if memo_path and os.path.exists(memo_path):
+        with open(memo_path) as f:
+            memo = json.load(f)
+
+    digests, updated = [], False
+    for path in paths:
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        entry = memo.get(path)
+        if entry is None or entry[:2] != [stat.st_size, stat.st_mtime_ns]:
+            h = hashlib.blake2b(digest_size=16)
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 24), b""):
+                    h.update(chunk)
+            entry = [stat.st_size, stat.st_mtime_ns, h.hexdigest()]
+            memo[path] = entry
+            updated = True
+        digests.append(entry[2])
+
+    if memo_path and updated:
+        with open(memo_path + ".tmp", "w") as f:
+            json.dump(memo, f)
+        os.replace(memo_path + ".tmp", memo_path)
+    return digests
+
+def digest_frame(df: pl.DataFrame) -> str:
+    h = hashlib.blake2b(str(df.schema).encode(), digest_size=16)
+    h.update(df.hash_rows(seed=0).to_numpy().tobytes())
+    return h.hexdigest()
+
+def evict(cache_dir: str, max_bytes: int = CACHE_MAX_BYTES):
+    # least recently used entries first; hits refresh the mtime of their files. Directory indexes
+    # of read_paths count as entries too
+    entries: dict[str, list[os.DirEntry]] = {}
+    for entry in os.scandir(cache_dir):
+        if entry.name.endswith(".arrow") or entry.name.startswith("paths-") and entry.name.endswith(".json"):
+            entries.setdefault(entry.name.split(".")[0], []).append(entry)
+
+    groups = sorted(
+        entries.values(),
+        key=lambda files: max(f.stat().st_mtime_ns for f in files),
+    )
+    total = sum(f.stat().st_size for files in groups for f in files)
+    for files in groups:
+        if total <= max_bytes:
+            break
+        for f in files:
+            total -= f.stat().st_size
+            os.remove(f.path)
+
+def entry_prefix(cache_dir: str, name: str, key_parts) -> str:
+    key = hashlib.blake2b(
+        "\0".join([name, str(CACHE_VERSION), pl.__version__, *key_parts()]).encode(), digest_size=16
+    ).hexdigest()
+    return os.path.join(cache_dir, f"{name}-{key}")
+
+def read_entry(prefix: str):
+    if os.path.exists(f"{prefix}.arrow"):
+        os.utime(f"{prefix}.arrow")
+        return pl.read_ipc(f"{prefix}.arrow", memory_map=False)
+    if os.path.exists(f"{prefix}.0.arrow"):
+        dfs = []
+        i = 0
+        while os.path.exists(f"{prefix}.{i}.arrow"):
+            os.utime(f"{prefix}.{i}.arrow")
+            dfs.append(pl.read_ipc(f"{prefix}.{i}.arrow", memory_map=False))
+            i += 1
+        return tuple(dfs)
+    return None
+
+def load_cached(cache_dir: str | None, name: str, key_parts):
+    # an existing entry, or None; nothing is computed or written
+    if cache_dir is None:
+        return None
+    return read_entry(entry_prefix(cache_dir, name, key_parts))
+
+def cached(cache_dir: str | None, name: str, key_parts, compute,
+           max_bytes: int = CACHE_MAX_BYTES):
+    # key_parts and compute are thunks so inputs are only hashed when caching is enabled
+    if cache_dir is None:
+        result = compute()
+        return result.collect() if isinstance(result, pl.LazyFrame) else result
+    os.makedirs(cache_dir, exist_ok=True)
+
+    prefix = entry_prefix(cache_dir, name, key_parts)
+    result = read_entry(prefix)
+    if result is not None:
+        return result
+
+    result = compute()
+    if isinstance(result, pl.LazyFrame):
+        result = result.collect()
+    if isinstance(result, pl.DataFrame):
+        outputs = [(f"{prefix}.arrow", result)]
+    else:
+        outputs = [(f"{prefix}.{i}.arrow", df) for i, df in enumerate(result)]
+    # publish the first table last so a partially written entry is never read back
+    for path, df in reversed(outputs):
+        df.write_ipc(path + ".tmp")
+        os.replace(path + ".tmp", path)
+
+    evict(cache_dir, max_bytes)
+    return result
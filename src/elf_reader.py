@@ -0,0 +1,423 @@
+import bisect
+import mmap
+import posixpath
+import re
+import struct
+import zlib
+import polars as pl
+
+SHT_PROGBITS = 1
+SHT_SYMTAB = 2
+SHF_EXECINSTR = 0x4
+SHF_COMPRESSED = 0x800
+STT_NOTYPE = 0
+STT_FUNC = 2
+SHN_LORESERVE = 0xff00
+
+DW_AT_stmt_list = 0x10
+DW_AT_comp_dir = 0x1b
+
+DW_LNCT_path = 1
+DW_LNCT_directory_index = 2
+
+def is_elf(path: str):
+    with open(path, "rb") as f:
+        return f.read(4) == b"\x7fELF"
+
+def read_uleb(data, pos: int):
+    result = shift = 0
+    while True:
+        b = data[pos]
+        pos += 1
+        result |= (b & 0x7f) << shift
+        if b < 0x80:
+            return result, pos
+        shift += 7
+
+def read_sleb(data, pos: int):
+    result = shift = 0
+    while True:
+        b = data[pos]
+        pos += 1
+        result |= (b & 0x7f) << shift
+        shift += 7
+        if b < 0x80:
+            if b & 0x40:
+                result -= 1 << shift
+            return result, pos
+
+def read_cstr(data, pos: int):
+    end = data.find(b"\0", pos)
+    return bytes(data[pos:end]).decode(errors="replace"), end + 1
+
+def read_sections(mm: mmap.mmap):
+    if mm[4] != 2 or mm[5] != 1:
+        raise ValueError("only little-endian ELF64 binaries are supported")
+    shoff, = struct.unpack_from("<Q", mm, 0x28)
+    shentsize, shnum, shstrndx = struct.unpack_from("<HHH", mm, 0x3a)
+
+    headers = [
+        struct.unpack_from("<IIQQQQIIQQ", mm, shoff + i * shentsize)
+        for i in range(shnum)
+    ]
+    strtab_offset = headers[shstrndx][4]
+    return [
+        {
+            "name": read_cstr(mm, strtab_offset + name)[0],
+            "type": sh_type, "flags": flags, "addr": addr,
+            "offset": offset, "size": size, "link": link, "entsize": entsize,
+        }
+        for name, sh_type, flags, addr, offset, size, link, _, _, entsize in headers
+    ]
+
+def section_data(mm: mmap.mmap, section: dict | None):
+    if section is None:
+        return b""
+    data = mm[section["offset"]:section["offset"] + section["size"]]
+    if section["flags"] & SHF_COMPRESSED:
+        ch_type, = struct.unpack_from("<I", data, 0)
+        if ch_type != 1:
+            raise ValueError(f"unsupported compressed section type {ch_type}")
+        data = zlib.decompress(data[24:])
+    return data
+
+def read_func_symbols(mm: mmap.mmap, sections: list[dict]):
+    symtab = next((s for s in sections if s["type"] == SHT_SYMTAB), None)
+    if symtab is None:
+        return [], []
+    strtab = sections[symtab["link"]]
+    symbols = []
+    for pos in range(symtab["offset"], symtab["offset"] + symtab["size"], symtab["entsize"]):
+        name, info, _, shndx, value, _ = struct.unpack_from("<IBBHQQ", mm, pos)
+        # untyped code symbols too (cold fragments, local labels), which objdump also names targets by
+        if (
+            info & 0xf in (STT_FUNC, STT_NOTYPE) and 0 < shndx < SHN_LORESERVE and value != 0 
+            and sections[shndx]["flags"] & SHF_EXECINSTR and name != 0
+        ):
+            symbols.append((value, info & 0xf == STT_FUNC, read_cstr(mm, strtab["offset"] + name)[0]))
+    # at a shared address the function symbol sorts last, so it names the target
+    symbols.sort()
+    symbols = [(value, name) for value, _, name in symbols]
+    return [value for value, _ in symbols], [name for _, name in symbols]
+
+def read_form(data, pos: int, form: int, offset_size: int, line_str: bytes, debug_str: bytes,
+              address_size: int = 8):
+    # string forms are resolved, except the indexed ones of split DWARF; other values stay raw
+    if form == 0x08:  # DW_FORM_string
+        return read_cstr(data, pos)
+    if form in (0x1f, 0x0e):  # DW_FORM_line_strp, DW_FORM_strp
+        offset = int.from_bytes(data[pos:pos + offset_size], "little")
+        return read_cstr(line_str if form == 0x1f else debug_str, offset)[0], pos + offset_size
+    if form in (0x0f, 0x15, 0x1a, 0x1b, 0x22, 0x23):  # udata, ref_udata, strx, addrx, loclistx, rnglistx
+        return read_uleb(data, pos)
+    if form == 0x0d:  # DW_FORM_sdata
+        return read_sleb(data, pos)
+    if form in (0x09, 0x18):  # DW_FORM_block, DW_FORM_exprloc
+        size, pos = read_uleb(data, pos)
+        return data[pos:pos + size], pos + size
+    if form in (0x0a, 0x03, 0x04):  # DW_FORM_block1, block2, block4
+        length = {0x0a: 1, 0x03: 2, 0x04: 4}[form]
+        size = int.from_bytes(data[pos:pos + length], "little")
+        return data[pos + length:pos + length + size], pos + length + size
+    if form in (0x19, 0x21):  # DW_FORM_flag_present, DW_FORM_implicit_const (value is in the abbrev)
+        return None, pos
+    if form == 0x16:  # DW_FORM_indirect
+        form, pos = read_uleb(data, pos)
+        return read_form(data, pos, form, offset_size, line_str, debug_str, address_size)
+    sizes = {
+        0x0b: 1, 0x0c: 1, 0x11: 1, 0x25: 1, 0x29: 1,  # data1, flag, ref1, strx1, addrx1
+        0x05: 2, 0x12: 2, 0x26: 2, 0x2a: 2,  # data2, ref2, strx2, addrx2
+        0x27: 3, 0x2b: 3,  # strx3, addrx3
+        0x06: 4, 0x13: 4, 0x1c: 4, 0x28: 4, 0x2c: 4,  # data4, ref4, ref_sup4, strx4, addrx4
+        0x07: 8, 0x14: 8, 0x20: 8, 0x24: 8,  # data8, ref8, ref_sig8, ref_sup8
+        0x1e: 16,  # data16
+        0x0e: offset_size, 0x10: offset_size, 0x17: offset_size, 0x1d: offset_size,  # ref_addr, sec_offset, strp_sup
+        0x01: address_size,  # addr
+    }
+    if form in sizes:
+        return int.from_bytes(data[pos:pos + sizes[form]], "little"), pos + sizes[form]
+    raise ValueError(f"unsupported DW_FORM 0x{form:x}")
+
+def read_comp_dirs(info: bytes, abbrev: bytes, debug_str: bytes, line_str: bytes):
+    # compilation directory of every unit by the offset of its line table, from the unit DIE
+    comp_dirs: dict[int, str] = {}
+    unit = 0
+    while unit < len(info):
+        unit_length, = struct.unpack_from("<I", info, unit)
+        offset_size, pos = 4, unit + 4
+        if unit_length == 0xffffffff:
+            unit_length, = struct.unpack_from("<Q", info, pos)
+            offset_size, pos = 8, pos + 8
+        unit_end = pos + unit_length
+
+        version, = struct.unpack_from("<H", info, pos)
+        pos += 2
+        if version >= 5:
+            unit_type, address_size = info[pos], info[pos + 1]
+            abbrev_offset = int.from_bytes(info[pos + 2:pos + 2 + offset_size], "little")
+            pos += 2 + offset_size
+            pos += {0x02: 16, 0x04: 8, 0x05: 8, 0x06: 16}.get(unit_type, 0)  # type and skeleton units
+        else:
+            abbrev_offset = int.from_bytes(info[pos:pos + offset_size], "little")
+            address_size = info[pos + offset_size]
+            pos += offset_size + 1
+
+        code, pos = read_uleb(info, pos)
+        # the abbreviation of the unit DIE: code, tag, children flag, then (attribute, form) pairs
+        a = abbrev_offset
+        while True:
+            abbrev_code, a = read_uleb(abbrev, a)
+            _, a = read_uleb(abbrev, a)
+            a += 1
+            attributes = []
+            while True:
+                attribute, a = read_uleb(abbrev, a)
+                form, a = read_uleb(abbrev, a)
+                if form == 0x21:
+                    _, a = read_sleb(abbrev, a)
+                if not attribute and not form:
+                    break
+                attributes.append((attribute, form))
+            if abbrev_code == code or not abbrev_code:
+                break
+
+        values = {}
+        for attribute, form in attributes:
+            values[attribute], pos = read_form(
+                info, pos, form, offset_size, line_str, debug_str, address_size
+            )
+        comp_dir = values.get(DW_AT_comp_dir)
+        if DW_AT_stmt_list in values and isinstance(comp_dir, str):
+            comp_dirs[values[DW_AT_stmt_list]] = comp_dir
+        unit = unit_end
+    return comp_dirs
+
+def read_entries(data, pos: int, offset_size: int, line_str: bytes, debug_str: bytes):
+    format_count = data[pos]
+    pos += 1
+    formats = []
+    for _ in range(format_count):
+        content, pos = read_uleb(data, pos)
+        form, pos = read_uleb(data, pos)
+        formats.append((content, form))
+    count, pos = read_uleb(data, pos)
+    entries = []
+    for _ in range(count):
+        entry = {}
+        for content, form in formats:
+            entry[content], pos = read_form(data, pos, form, offset_size, line_str, debug_str)
+        entries.append(entry)
+    return entries, pos
+
+def decode_debug_line(data: bytes, line_str: bytes = b"", debug_str: bytes = b"",
+                      comp_dirs: dict[int, str] | None = None):
+    # rows of every line-number program as (address, file id, line, end_sequence)
+    comp_dirs = comp_dirs or {}
+    file_ids: dict[str, int] = {}
+    addresses, files, lines, ends = [], [], [], []
+
+    unit = 0
+    while unit < len(data):
+        unit_length, = struct.unpack_from("<I", data, unit)
+        offset_size, pos = 4, unit + 4
+        if unit_length == 0xffffffff:
+            unit_length, = struct.unpack_from("<Q", data, pos)
+            offset_size, pos = 8, pos + 8
+        unit_end = pos + unit_length
+
+        version, = struct.unpack_from("<H", data, pos)
+        pos += 2
+        if version >= 5:
+            pos += 2  # address_size, segment_selector_size
+        header_length = int.from_bytes(data[pos:pos + offset_size], "little")
+        pos += offset_size
+        program = pos + header_length
+
+        min_inst_length = data[pos]
+        pos += 2 if version >= 4 else 1  # maximum_operations_per_instruction
+        line_base = struct.unpack_from("<b", data, pos + 1)[0]  # after default_is_stmt
+        line_range = data[pos + 2]
+        opcode_base = data[pos + 3]
+        opcode_lengths = data[pos + 4:pos + 3 + opcode_base]
+        pos += 3 + opcode_base
+
+        if version >= 5:
+            dirs, pos = read_entries(data, pos, offset_size, line_str, debug_str)
+            # directory 0 is the compilation directory, which relative entries extend
+            dirs = [d.get(DW_LNCT_path, "") for d in dirs]
+            dirs = dirs[:1] + [posixpath.join(dirs[0], d) for d in dirs[1:]]
+            names, pos = read_entries(data, pos, offset_size, line_str, debug_str)
+            names = [
+                posixpath.join(dirs[n.get(DW_LNCT_directory_index, 0)], n.get(DW_LNCT_path, ""))
+                for n in names
+            ]
+        else:
+            # before DWARF 5 directory 0 is the unit's DW_AT_comp_dir, which relative entries extend
+            comp_dir = comp_dirs.get(unit, "")
+            dirs = [comp_dir]
+            while data[pos]:
+                d, pos = read_cstr(data, pos)
+                dirs.append(posixpath.join(comp_dir, d))
+            pos += 1
+            names = [None]
+            while data[pos]:
+                name, pos = read_cstr(data, pos)
+                d, pos = read_uleb(data, pos)
+                _, pos = read_uleb(data, pos)
+                _, pos = read_uleb(data, pos)
+                names.append(posixpath.join(dirs[d], name))
+            pos += 1
+        ids = [file_ids.setdefault(name, len(file_ids)) if name is not None else -1 for name in names]
+
+        pos = program
+        address, file, line = 0, 1, 1
+        const_pc = (255 - opcode_base) // line_range * min_inst_length
+        while pos < unit_end:
+            opcode = data[pos]
+            pos += 1
+            if opcode >= opcode_base:
+                adjusted = opcode - opcode_base
+                address += adjusted // line_range * min_inst_length
+                line += line_base + adjusted % line_range
+                addresses.append(address); files.append(ids[file]); lines.append(line); ends.append(False)
+            elif opcode == 0:
+                length, pos = read_uleb(data, pos)
+                sub, next_pos = data[pos], pos + length
+                if sub == 1:  # DW_LNE_end_sequence
+                    addresses.append(address); files.append(-1); lines.append(None); ends.append(True)
+                    address, file, line = 0, 1, 1
+                elif sub == 2:  # DW_LNE_set_address
+                    address = int.from_bytes(data[pos + 1:next_pos], "little")
+                elif sub == 3:  # DW_LNE_define_file
+                    name, p = read_cstr(data, pos + 1)
+                    d, _ = read_uleb(data, p)
+                    name = posixpath.join(dirs[d], name)
+                    ids.append(file_ids.setdefault(name, len(file_ids)))
+                pos = next_pos
+            elif opcode == 1:  # DW_LNS_copy
+                addresses.append(address); files.append(ids[file]); lines.append(line); ends.append(False)
+            elif opcode == 2:  # DW_LNS_advance_pc
+                delta, pos = read_uleb(data, pos)
+                address += delta * min_inst_length
+            elif opcode == 3:  # DW_LNS_advance_line
+                delta, pos = read_sleb(data, pos)
+                line += delta
+            elif opcode == 4:  # DW_LNS_set_file
+                file, pos = read_uleb(data, pos)
+            elif opcode == 8:  # DW_LNS_const_add_pc
+                address += const_pc
+            elif opcode == 9:  # DW_LNS_fixed_advance_pc
+                address += struct.unpack_from("<H", data, pos)[0]
+                pos += 2
+            else:
+                for _ in range(opcode_lengths[opcode - 1]):
+                    _, pos = read_uleb(data, pos)
+        unit = unit_end
+
+    return (
+        pl.DataFrame(
+            {"address": addresses, "file_id": files, "line": lines, "end": ends},
+            schema={"address": pl.Int64, "file_id": pl.Int64, "line": pl.Int64, "end": pl.Boolean},
+        )
+        .join(
+            pl.DataFrame(
+                {"file_id": list(file_ids.values()), "file": list(file_ids.keys())},
+                schema={"file_id": pl.Int64, "file": pl.String},
+            ),
+            on="file_id", how="left",
+        )
+        .drop("file_id")
+    )
+
+def to_hex(sign: str, digits: str):
+    value = int(sign + digits)
+    # 64-bit immediates come back unsigned
+    if value >= 1 << 63:
+        value -= 1 << 64
+    return f"-0x{-value:x}" if value < 0 else f"0x{value:x}"
+
+def format_operand(operand: str):
+    # match llvm-objdump 15 and later (LLVM 18 on the README's Ubuntu 24.04): hex immediates and
+    # displacements, where capstone prints values below 10 in decimal, no spaces inside memory operands
+    operand = re.sub(r"\$(-?)(\d+)\b(?!x)", lambda m: "$" + to_hex(m.group(1), m.group(2)), operand)
+    operand = re.sub(r"(?<![\w$])(-?)(\d+)\(", lambda m: to_hex(m.group(1), m.group(2)) + "(", operand)
+    return re.sub(r"\(([^)]*)\)", lambda m: "(" + m.group(1).replace(", ", ",") + ")", operand)
+
+def block_ranges(node_df: pl.DataFrame):
+    ranges: list[list[int]] = []
+    for start, end in (
+        node_df.select("start_address", "end_address").sort("start_address").iter_rows()
+    ):
+        if ranges and start <= ranges[-1][1]:
+            ranges[-1][1] = max(ranges[-1][1], end)
+        else:
+            ranges.append([start, end])
+    return ranges
+
+def read_elf_ins(binary_path: str, node_df: pl.DataFrame):
+    try:
+        import capstone
+    except ImportError as e:
+        raise ImportError("reading instructions from an ELF binary requires the capstone package") from e
+
+    md = capstone.Cs(capstone.CS_ARCH_X86, capstone.CS_MODE_64)
+    md.syntax = capstone.CS_OPT_SYNTAX_ATT
+    md.skipdata = True
+    target_re = re.compile(r"^0x([0-9a-f]+)$")
+
+    with open(binary_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        sections = read_sections(mm)
+        named_sections = {s["name"]: s for s in sections}
+        text_sections = [
+            s for s in sections
+            if s["type"] == SHT_PROGBITS and s["flags"] & SHF_EXECINSTR
+        ]
+        sym_addresses, sym_names = read_func_symbols(mm, sections)
+
+        addresses, instructions = [], []
+        for start, end in block_ranges(node_df):
+            section = next(
+                (s for s in text_sections if s["addr"] <= start and end <= s["addr"] + s["size"]),
+                None,
+            )
+            if section is None:
+                continue
+            offset = section["offset"] + start - section["addr"]
+            for address, _, mnemonic, operand in md.disasm_lite(mm[offset:offset + end - start], start):
+                match = target_re.match(operand)
+                if not match:
+                    operand = format_operand(operand)
+                elif mnemonic.startswith("j") or mnemonic.startswith("call"):
+                    # symbolize direct branch targets the way objdump prints them
+                    target = int(match.group(1), 16)
+                    i = bisect.bisect_right(sym_addresses, target) - 1
+                    if i >= 0:
+                        delta = target - sym_addresses[i]
+                        operand += f" <{sym_names[i]}+0x{delta:x}>" if delta else f" <{sym_names[i]}>"
+                addresses.append(address)
+                instructions.append(f"{mnemonic}\t{operand}" if operand else mnemonic)
+
+        line_str = section_data(mm, named_sections.get(".debug_line_str"))
+        debug_str = section_data(mm, named_sections.get(".debug_str"))
+        line_df = decode_debug_line(
+            section_data(mm, named_sections.get(".debug_line")), line_str, debug_str,
+            read_comp_dirs(
+                section_data(mm, named_sections.get(".debug_info")),
+                section_data(mm, named_sections.get(".debug_abbrev")),
+                debug_str, line_str,
+            ),
+        )
+
+    return (
+        pl.DataFrame(
+            {"address": addresses, "instruction": instructions},
+            schema={"address": pl.Int64, "instruction": pl.String},
+        )
+        .join_asof(
+            # end-of-sequence rows sort first so a sequence starting at the same address wins
+            line_df.sort("address", pl.col("end").not_())
+            .unique("address", keep="last", maintain_order=True)
+            .drop("end"),
+            on="address",
+        )
+    )
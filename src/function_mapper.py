@@ -1,421 +1,127 @@
 import numpy as np
 import polars as pl
 from path_mapper import replace_with_path
-from utils import levenshtein_similarity_expr
+from assignment import assign_pairs
+from utils import levenshtein_similarity_expr, SimilarityCache
 
 def update_func_map(match_df: pl.DataFrame):
-    func_map_df = match_df.select(
+    return assign_pairs(match_df, "similarity", tie_break=["old_func", "new_func"]).select(
         "old_fid", "old_func", "old_path", "old_line", 
         "new_fid", "new_func", "new_path", "new_line",
-    ).sample(0)
-    match_df = match_df.with_columns(pl.col("similarity").rank("min", descending=True).alias("rank"))
-    while not match_df.is_empty():
-        map_df = (
-            match_df
-            .filter(
-                pl.col("rank").min().over("old_fid").eq(pl.col("rank")) &
-                pl.col("rank").min().over("new_fid").eq(pl.col("rank"))
-            )
-            .sort("old_func", "new_func")
-            .group_by("old_fid")
-            .first()
-            .sort("old_func", "new_func")
-            .group_by("new_fid")
-            .first()
-            .select("old_fid", "old_func", "old_path", "old_line", 
-                    "new_fid", "new_func", "new_path", "new_line")
-        )
-        match_df = (
-            match_df
-            .join(map_df, on="new_fid", how="anti")
-            .join(map_df, on="old_fid", how="anti")
-        )
-        func_map_df.vstack(map_df, in_place=True)
-    
-    return func_map_df
-
-def map_func_internal(old_func_info_df: pl.DataFrame, new_func_info_df: pl.DataFrame, 
-                      old_yaml_func_df: pl.DataFrame):
-    # declare collection to keep incrementally computed function maps
-    func_map_dfs: list[pl.DataFrame] = []
+    )
 
-    old_column_exprs = old_func_info_df.columns
-    new_column_exprs = [pl.col(col + "_right").alias(col) for col in new_func_info_df.columns]
+# each stage: (match keys, similarity fields maximized in order, yaml functions only, keep cold splits apart)
+FUNC_CASCADE = [
+    (["func"], [], False, False),
+    (["namespace", "basename", "parameters", "extension", "chunk"], ["len"], False, False),
+    (["namespace", "basename", "parameters", "extension"], ["chunk", "len"], True, False),
+    (["namespace", "basename", "parameters"], ["extension", "chunk", "len"], True, True),
+    (["path", "namespace", "basename"], ["parameters", "extension", "chunk", "len"], True, True),
+    (["namespace", "basename"], ["parameters", "extension", "chunk", "len"], True, True),
+    (["path", "basename", "parameters"], ["namespace", "extension", "chunk", "len"], True, True),
+    (["basename", "parameters"], ["namespace", "extension", "chunk", "len"], True, True),
+]
+
+# branches all start from what the cascade left; their maps are reconciled against each other
+FUNC_CASCADE_BRANCHES = [
+    [
+        (["path", "basename"], ["namespace", "parameters", "extension", "chunk", "len"], True, True),
+        (["basename"], ["namespace", "parameters", "extension", "chunk", "len"], True, True),
+    ],
+    [
+        (["path", "namespace"], ["basename", "parameters", "extension", "chunk", "len"], True, True),
+        (["path"], ["funcname", "parameters", "extension", "chunk", "len"], True, True),
+        (["file"], ["funcname", "parameters", "extension", "chunk", "len"], True, True),
+    ],
+]
+
+def func_similarity_expr(fields: list[str], similarity_cache: SimilarityCache | None = None):
+    if not fields:
+        return pl.lit(1)
+    exprs = {
+        "funcname": (
+            levenshtein_similarity_expr("namespace", "namespace_right", similarity_cache) +
+            levenshtein_similarity_expr("basename", "basename_right", similarity_cache)
+        ),
+        "len": -1*(pl.col("old_func").str.len_chars().cast(int) - pl.col("new_func").str.len_chars()).abs(),
+    }
+    return pl.struct(**{
+        field: exprs[field] if field in exprs else levenshtein_similarity_expr(field, field + "_right", similarity_cache)
+        for field in fields
+    })
+
+def map_func_stage(old_func_info_df: pl.DataFrame, new_func_info_df: pl.DataFrame, 
+                   old_yaml_func_df: pl.DataFrame, keys: list[str], fields: list[str], 
+                   yaml_only: bool, split_cold: bool, similarity_cache: SimilarityCache | None = None):
     rename_columns = {
         "fid": "old_fid", "func": "old_func", "path": "old_path", "line": "old_line", 
         "fid_right": "new_fid", "func_right": "new_func", "path_right": "new_path", "line_right": "new_line", 
     }
-
-    full_df = old_func_info_df.join(new_func_info_df, on=["func"], how="full")
-    old_func_info_df = full_df.filter(pl.col("func").is_not_null() & pl.col("func_right").is_null()).select(old_column_exprs)
-    new_func_info_df = full_df.filter(pl.col("func").is_null() & pl.col("func_right").is_not_null()).select(new_column_exprs)
-
-    df = (
-        full_df.filter(pl.col("func").is_not_null() & pl.col("func_right").is_not_null())
-        # .join(old_yaml_func_df.select("func"), on="func")
-        .rename(rename_columns)
-        .with_columns(pl.lit(1).alias("similarity"))
-    )
-
-    map_df = update_func_map(df)
-    old_func_info_df = old_func_info_df.join(map_df, left_on="fid", right_on="old_fid", how="anti")
-    new_func_info_df = new_func_info_df.join(map_df, left_on="fid", right_on="new_fid", how="anti")
-    func_map_dfs.append(map_df)
-
-    # match: "namespace", "basename", "parameters", "extension", "chunk"
-    # maximize similarity: "len"
-    full_df = old_func_info_df.join(new_func_info_df, on=["namespace", "basename", "parameters", "extension", "chunk"], how="full")
-    old_func_info_df = full_df.filter(pl.col("func").is_not_null() & pl.col("func_right").is_null()).select(old_column_exprs)
-    new_func_info_df = full_df.filter(pl.col("func").is_null() & pl.col("func_right").is_not_null()).select(new_column_exprs)
-
-    df = (
-        full_df.filter(pl.col("func").is_not_null() & pl.col("func_right").is_not_null())
-        # .join(old_yaml_func_df.select("func"), on="func")
-        .rename(rename_columns)
-        .with_columns(
-            (-1*(pl.col("old_func").str.len_chars().cast(int) - pl.col("new_func").str.len_chars()).abs())
-            .alias("similarity")
-        )
-    )
-
-    map_df = update_func_map(df)
-    old_func_info_df = old_func_info_df.join(map_df, left_on="fid", right_on="old_fid", how="anti")
-    new_func_info_df = new_func_info_df.join(map_df, left_on="fid", right_on="new_fid", how="anti")
-    func_map_dfs.append(map_df)
-
-    # match: "namespace", "basename", "parameters", "extension"
-    # maximize similarity: "chunk", "len"
-    full_df = old_func_info_df.join(new_func_info_df, on=["namespace", "basename", "parameters", "extension"], how="full")
-    old_func_info_df = full_df.filter(pl.col("func").is_not_null() & pl.col("func_right").is_null()).select(old_column_exprs)
-    new_func_info_df = full_df.filter(pl.col("func").is_null() & pl.col("func_right").is_not_null()).select(new_column_exprs)
-
-    df = (
-        full_df.filter(pl.col("func").is_not_null() & pl.col("func_right").is_not_null())
-        .join(old_yaml_func_df.select("func"), on="func")
-        .rename(rename_columns)
-        .with_columns(
-            pl.struct(
-                chunk=levenshtein_similarity_expr("chunk", "chunk_right"),
-                len=-1*(pl.col("old_func").str.len_chars().cast(int) - pl.col("new_func").str.len_chars()).abs()
-            ).alias("similarity")
-        )
-    )
-
-    map_df = update_func_map(df)
-    old_func_info_df = old_func_info_df.join(map_df, left_on="fid", right_on="old_fid", how="anti")
-    new_func_info_df = new_func_info_df.join(map_df, left_on="fid", right_on="new_fid", how="anti")
-    func_map_dfs.append(map_df)
-
-    # match: "namespace", "basename", "parameters"
-    # maximize similarity: "extension", "chunk", "len"
-    full_df = old_func_info_df.join(new_func_info_df, on=["namespace", "basename", "parameters"], how="full")
-    old_func_info_df = full_df.filter(pl.col("func").is_not_null() & pl.col("func_right").is_null()).select(old_column_exprs)
-    new_func_info_df = full_df.filter(pl.col("func").is_null() & pl.col("func_right").is_not_null()).select(new_column_exprs)
-
-    df = (
-        full_df.filter(pl.col("func").is_not_null() & pl.col("func_right").is_not_null())
-        .join(old_yaml_func_df.select("func"), on="func")
-        .filter(pl.col("extension").str.contains("cold") == pl.col("extension_right").str.contains("cold"))
-        .rename(rename_columns)
-        .with_columns(
-            pl.struct(
-                extension=levenshtein_similarity_expr("extension", "extension_right"),
-                chunk=levenshtein_similarity_expr("chunk", "chunk_right"),
-                len=-1*(pl.col("old_func").str.len_chars().cast(int) - pl.col("new_func").str.len_chars()).abs()
-            ).alias("similarity")
-        )
-    )
-
-    map_df = update_func_map(df)
-    old_func_info_df = old_func_info_df.join(map_df, left_on="fid", right_on="old_fid", how="anti")
-    new_func_info_df = new_func_info_df.join(map_df, left_on="fid", right_on="new_fid", how="anti")
-    func_map_dfs.append(map_df)
-    
-    # match: "path", "namespace", "basename"
-    # maximize similarity: "parameters", "extension", "chunk", "len"
-    full_df = old_func_info_df.join(new_func_info_df, on=["path", "namespace", "basename"], how="full")
-    old_func_info_df = full_df.filter(pl.col("func").is_not_null() & pl.col("func_right").is_null()).select(old_column_exprs)
-    new_func_info_df = full_df.filter(pl.col("func").is_null() & pl.col("func_right").is_not_null()).select(new_column_exprs)
-
-    df = (
-        full_df.filter(pl.col("func").is_not_null() & pl.col("func_right").is_not_null())
-        .join(old_yaml_func_df.select("func"), on="func")
-        .filter(pl.col("extension").str.contains("cold") == pl.col("extension_right").str.contains("cold"))
-        .rename(rename_columns)
-        .with_columns(
-            pl.struct(
-                parameters=levenshtein_similarity_expr("parameters", "parameters_right"),
-                extension=levenshtein_similarity_expr("extension", "extension_right"),
-                chunk=levenshtein_similarity_expr("chunk", "chunk_right"),
-                len=-1*(pl.col("old_func").str.len_chars().cast(int) - pl.col("new_func").str.len_chars()).abs()
-            ).alias("similarity")
-        )
-    )
-
-    map_df = update_func_map(df)
-    old_func_info_df = old_func_info_df.join(map_df, left_on="fid", right_on="old_fid", how="anti")
-    new_func_info_df = new_func_info_df.join(map_df, left_on="fid", right_on="new_fid", how="anti")
-    func_map_dfs.append(map_df)
-    
-    # match: "namespace", "basename"
-    # maximize similarity: "parameters", "extension", "chunk", "len"
-    full_df = old_func_info_df.join(new_func_info_df, on=["namespace", "basename"], how="full")
-    old_func_info_df = full_df.filter(pl.col("func").is_not_null() & pl.col("func_right").is_null()).select(old_column_exprs)
-    new_func_info_df = full_df.filter(pl.col("func").is_null() & pl.col("func_right").is_not_null()).select(new_column_exprs)
-
-    df = (
-        full_df.filter(pl.col("func").is_not_null() & pl.col("func_right").is_not_null())
-        .join(old_yaml_func_df.select("func"), on="func")
-        .filter(pl.col("extension").str.contains("cold") == pl.col("extension_right").str.contains("cold"))
-        .rename(rename_columns)
-        .with_columns(
-            pl.struct(
-                parameters=levenshtein_similarity_expr("parameters", "parameters_right"),
-                extension=levenshtein_similarity_expr("extension", "extension_right"),
-                chunk=levenshtein_similarity_expr("chunk", "chunk_right"),
-                len=-1*(pl.col("old_func").str.len_chars().cast(int) - pl.col("new_func").str.len_chars()).abs()
-            ).alias("similarity")
-        )
-    )
-
-    map_df = update_func_map(df)
-    old_func_info_df = old_func_info_df.join(map_df, left_on="fid", right_on="old_fid", how="anti")
-    new_func_info_df = new_func_info_df.join(map_df, left_on="fid", right_on="new_fid", how="anti")
-    func_map_dfs.append(map_df)
-
-    # match: "path", "basename", "parameters"
-    # maximize similarity: "namespace", "extension", "chunk", "len"
-    full_df = old_func_info_df.join(new_func_info_df, on=["path", "basename", "parameters"], how="full")
-    old_func_info_df = full_df.filter(pl.col("func").is_not_null() & pl.col("func_right").is_null()).select(old_column_exprs)
-    new_func_info_df = full_df.filter(pl.col("func").is_null() & pl.col("func_right").is_not_null()).select(new_column_exprs)
-
-    df = (
-        full_df.filter(pl.col("func").is_not_null() & pl.col("func_right").is_not_null())
-        .join(old_yaml_func_df.select("func"), on="func")
-        .filter(pl.col("extension").str.contains("cold") == pl.col("extension_right").str.contains("cold"))
-        .rename(rename_columns)
-        .with_columns(
-            pl.struct(
-                namespace=levenshtein_similarity_expr("namespace", "namespace_right"),
-                extension=levenshtein_similarity_expr("extension", "extension_right"),
-                chunk=levenshtein_similarity_expr("chunk", "chunk_right"),
-                len=-1*(pl.col("old_func").str.len_chars().cast(int) - pl.col("new_func").str.len_chars()).abs()
-            ).alias("similarity")
-        )
-    )
-
-    map_df = update_func_map(df)
-    old_func_info_df = old_func_info_df.join(map_df, left_on="fid", right_on="old_fid", how="anti")
-    new_func_info_df = new_func_info_df.join(map_df, left_on="fid", right_on="new_fid", how="anti")
-    func_map_dfs.append(map_df)
-
-    # match: "basename", "parameters"
-    # maximize similarity: "namespace", "extension", "chunk", "len"
-    full_df = old_func_info_df.join(new_func_info_df, on=["basename", "parameters"], how="full")
-    old_func_info_df = full_df.filter(pl.col("func").is_not_null() & pl.col("func_right").is_null()).select(old_column_exprs)
-    new_func_info_df = full_df.filter(pl.col("func").is_null() & pl.col("func_right").is_not_null()).select(new_column_exprs)
-
-    df = (
-        full_df.filter(pl.col("func").is_not_null() & pl.col("func_right").is_not_null())
-        .join(old_yaml_func_df.select("func"), on="func")
-        .filter(pl.col("extension").str.contains("cold") == pl.col("extension_right").str.contains("cold"))
-        .rename(rename_columns)
-        .with_columns(
-            pl.struct(
-                namespace=levenshtein_similarity_expr("namespace", "namespace_right"),
-                extension=levenshtein_similarity_expr("extension", "extension_right"),
-                chunk=levenshtein_similarity_expr("chunk", "chunk_right"),
-                len=-1*(pl.col("old_func").str.len_chars().cast(int) - pl.col("new_func").str.len_chars()).abs()
-            ).alias("similarity")
-        )
-    )
-
-    map_df = update_func_map(df)
-    old_func_info_df = old_func_info_df.join(map_df, left_on="fid", right_on="old_fid", how="anti")
-    new_func_info_df = new_func_info_df.join(map_df, left_on="fid", right_on="new_fid", how="anti")
-    func_map_dfs.append(map_df)
-    
-    # take multiple paths from here
-    temp_map_dfs: list[pl.DataFrame] = []
-
-    old_func_info_remain_df = old_func_info_df
-    new_func_info_remain_df = new_func_info_df
-    
-    # path 1
-    # match: "path", "basename"
-    # maximize similarity: "namespace", "parameters", "extension", "chunk", "len"
-    full_df = old_func_info_df.join(new_func_info_df, on=["path", "basename"], how="full")
-    old_func_info_df = full_df.filter(pl.col("func").is_not_null() & pl.col("func_right").is_null()).select(old_column_exprs)
-    new_func_info_df = full_df.filter(pl.col("func").is_null() & pl.col("func_right").is_not_null()).select(new_column_exprs)
-
-    df = (
-        full_df.filter(pl.col("func").is_not_null() & pl.col("func_right").is_not_null())
-        .join(old_yaml_func_df.select("func"), on="func")
-        .filter(pl.col("extension").str.contains("cold") == pl.col("extension_right").str.contains("cold"))
-        .rename(rename_columns)
-        .with_columns(
-            pl.struct(
-                namespace=levenshtein_similarity_expr("namespace", "namespace_right"),
-                parameters=levenshtein_similarity_expr("parameters", "parameters_right"),
-                extension=levenshtein_similarity_expr("extension", "extension_right"),
-                chunk=levenshtein_similarity_expr("chunk", "chunk_right"),
-                len=-1*(pl.col("old_func").str.len_chars().cast(int) - pl.col("new_func").str.len_chars()).abs()
-            ).alias("similarity")
-        )
-    )
-
-    map_df = update_func_map(df)
-    old_func_info_df = old_func_info_df.join(map_df, left_on="fid", right_on="old_fid", how="anti")
-    new_func_info_df = new_func_info_df.join(map_df, left_on="fid", right_on="new_fid", how="anti")
-    temp_map_dfs.append(map_df)
-    
-    # match: "basename"
-    # maximize similarity: "namespace", "parameters", "extension", "chunk", "len"
-    full_df = old_func_info_df.join(new_func_info_df, on=["basename"], how="full")
-    old_func_info_df = full_df.filter(pl.col("func").is_not_null() & pl.col("func_right").is_null()).select(old_column_exprs)
-    new_func_info_df = full_df.filter(pl.col("func").is_null() & pl.col("func_right").is_not_null()).select(new_column_exprs)
-
-    df = (
-        full_df.filter(pl.col("func").is_not_null() & pl.col("func_right").is_not_null())
-        .join(old_yaml_func_df.select("func"), on="func")
-        .filter(pl.col("extension").str.contains("cold") == pl.col("extension_right").str.contains("cold"))
-        .rename(rename_columns)
-        .with_columns(
-            pl.struct(
-                namespace=levenshtein_similarity_expr("namespace", "namespace_right"),
-                parameters=levenshtein_similarity_expr("parameters", "parameters_right"),
-                extension=levenshtein_similarity_expr("extension", "extension_right"),
-                chunk=levenshtein_similarity_expr("chunk", "chunk_right"),
-                len=-1*(pl.col("old_func").str.len_chars().cast(int) - pl.col("new_func").str.len_chars()).abs()
-            ).alias("similarity")
-        )
-    )
-
-    map_df = update_func_map(df)
-    old_func_info_df = old_func_info_df.join(map_df, left_on="fid", right_on="old_fid", how="anti")
-    new_func_info_df = new_func_info_df.join(map_df, left_on="fid", right_on="new_fid", how="anti")
-    temp_map_dfs.append(map_df)
-
-    # path 2
-    old_func_info_df = old_func_info_remain_df
-    new_func_info_df = new_func_info_remain_df
-    
-    # match: "path", "namespace"
-    # maximize similarity: "basename", "parameters", "extension", "chunk", "len"
-    full_df = old_func_info_df.join(new_func_info_df, on=["path", "namespace"], how="full")
-    old_func_info_df = full_df.filter(pl.col("func").is_not_null() & pl.col("func_right").is_null()).select(old_column_exprs)
-    new_func_info_df = full_df.filter(pl.col("func").is_null() & pl.col("func_right").is_not_null()).select(new_column_exprs)
-
-    df = (
-        full_df.filter(pl.col("func").is_not_null() & pl.col("func_right").is_not_null())
-        .join(old_yaml_func_df.select("func"), on="func")
-        .filter(pl.col("extension").str.contains("cold") == pl.col("extension_right").str.contains("cold"))
-        .rename(rename_columns)
-        .with_columns(
-            pl.struct(
-                basename=levenshtein_similarity_expr("basename", "basename_right"),
-                parameters=levenshtein_similarity_expr("parameters", "parameters_right"),
-                extension=levenshtein_similarity_expr("extension", "extension_right"),
-                chunk=levenshtein_similarity_expr("chunk", "chunk_right"),
-                len=-1*(pl.col("old_func").str.len_chars().cast(int) - pl.col("new_func").str.len_chars()).abs()
-            ).alias("similarity")
-        )
-    )
-
-    map_df = update_func_map(df)
-    old_func_info_df = old_func_info_df.join(map_df, left_on="fid", right_on="old_fid", how="anti")
-    new_func_info_df = new_func_info_df.join(map_df, left_on="fid", right_on="new_fid", how="anti")
-    temp_map_dfs.append(map_df)
-
-    # match: "path"
-    # maximize similarity: "namespace", "basename", "parameters", "extension", "chunk", "len"
-    full_df = old_func_info_df.join(new_func_info_df, on=["path"], how="full")
-    old_func_info_df = full_df.filter(pl.col("func").is_not_null() & pl.col("func_right").is_null()).select(old_column_exprs)
-    new_func_info_df = full_df.filter(pl.col("func").is_null() & pl.col("func_right").is_not_null()).select(new_column_exprs)
-
-    df = (
-        full_df.filter(pl.col("func").is_not_null() & pl.col("func_right").is_not_null())
-        .join(old_yaml_func_df.select("func"), on="func")
-        .filter(pl.col("extension").str.contains("cold") == pl.col("extension_right").str.contains("cold"))
-        .rename(rename_columns)
-        .with_columns(
-            pl.struct(
-                funcname=(
-                    levenshtein_similarity_expr("namespace", "namespace_right") +
-                    levenshtein_similarity_expr("basename", "basename_right")
-                ),
-                parameters=levenshtein_similarity_expr("parameters", "parameters_right"),
-                extension=levenshtein_similarity_expr("extension", "extension_right"),
-                chunk=levenshtein_similarity_expr("chunk", "chunk_right"),
-                len=-1*(pl.col("old_func").str.len_chars().cast(int) - pl.col("new_func").str.len_chars()).abs()
-            ).alias("similarity")
-        )
+    # one hashed key per stage; a null in any key column never matches, as in a multi-column join
+    key_expr = (
+        pl.when(pl.any_horizontal(pl.col(keys).is_null())).then(None)
+        .otherwise(pl.struct(keys).hash())
+        .alias("_key")
+    )
+    old_func_info_df = old_func_info_df.with_columns(key_expr)
+    new_func_info_df = new_func_info_df.with_columns(key_expr)
+
+    df = old_func_info_df.join(new_func_info_df, on="_key").drop("_key")
+    if yaml_only:
+        df = df.join(old_yaml_func_df.select("func"), on="func")
+    if split_cold:
+        df = df.filter(pl.col("extension").str.contains("cold") == pl.col("extension_right").str.contains("cold"))
+    map_df = update_func_map(
+        df.rename(rename_columns)
+        .with_columns(func_similarity_expr(fields, similarity_cache).alias("similarity"))
+    )
+
+    # functions that met a partner on the keys leave the cascade, mapped or not
+    return (
+        map_df,
+        old_func_info_df.join(new_func_info_df, on="_key", how="anti").drop("_key")
+        .join(map_df, left_on="fid", right_on="old_fid", how="anti"),
+        new_func_info_df.join(old_func_info_df, on="_key", how="anti").drop("_key")
+        .join(map_df, left_on="fid", right_on="new_fid", how="anti"),
     )
 
-    map_df = update_func_map(df)
-    old_func_info_df = old_func_info_df.join(map_df, left_on="fid", right_on="old_fid", how="anti")
-    new_func_info_df = new_func_info_df.join(map_df, left_on="fid", right_on="new_fid", how="anti")
-    temp_map_dfs.append(map_df)
+def map_func_internal(old_func_info_df: pl.DataFrame, new_func_info_df: pl.DataFrame, 
+                      old_yaml_func_df: pl.DataFrame, similarity_cache: SimilarityCache | None = None):
+    # declare collection to keep incrementally computed function maps
+    func_map_dfs: list[pl.DataFrame] = []
 
     # convert: "path" -> "filename"
     old_func_info_df = old_func_info_df.with_columns(pl.col("path").str.replace(r".*/", "").alias("file"))
     new_func_info_df = new_func_info_df.with_columns(pl.col("path").str.replace(r".*/", "").alias("file"))
 
-    # match: "filename"
-    # maximize similarity: "namespace", "basename", "parameters", "extension", "chunk", "len"
-    full_df = old_func_info_df.join(new_func_info_df, on=["file"], how="full")
-    old_func_info_df = full_df.filter(pl.col("func").is_not_null() & pl.col("func_right").is_null()).select(old_column_exprs)
-    new_func_info_df = full_df.filter(pl.col("func").is_null() & pl.col("func_right").is_not_null()).select(new_column_exprs)
-
-    df = (
-        full_df.filter(pl.col("func").is_not_null() & pl.col("func_right").is_not_null())
-        .join(old_yaml_func_df.select("func"), on="func")
-        .filter(pl.col("extension").str.contains("cold") == pl.col("extension_right").str.contains("cold"))
-        .rename(rename_columns)
-        .with_columns(
-            pl.struct(
-                funcname=(
-                    levenshtein_similarity_expr("namespace", "namespace_right") +
-                    levenshtein_similarity_expr("basename", "basename_right")
-                ),
-                parameters=levenshtein_similarity_expr("parameters", "parameters_right"),
-                extension=levenshtein_similarity_expr("extension", "extension_right"),
-                chunk=levenshtein_similarity_expr("chunk", "chunk_right"),
-                len=-1*(pl.col("old_func").str.len_chars().cast(int) - pl.col("new_func").str.len_chars()).abs()
-            ).alias("similarity")
+    for stage in FUNC_CASCADE:
+        map_df, old_func_info_df, new_func_info_df = map_func_stage(
+            old_func_info_df, new_func_info_df, old_yaml_func_df, *stage, similarity_cache
         )
-    )
+        func_map_dfs.append(map_df)
 
-    map_df = update_func_map(df)
-    old_func_info_df = old_func_info_df.join(map_df, left_on="fid", right_on="old_fid", how="anti")
-    new_func_info_df = new_func_info_df.join(map_df, left_on="fid", right_on="new_fid", how="anti")
-    temp_map_dfs.append(map_df)
+    # take multiple paths from here
+    temp_map_dfs: list[pl.DataFrame] = []
+    for branch in FUNC_CASCADE_BRANCHES:
+        old_branch_df, new_branch_df = old_func_info_df, new_func_info_df
+        for stage in branch:
+            map_df, old_branch_df, new_branch_df = map_func_stage(
+                old_branch_df, new_branch_df, old_yaml_func_df, *stage, similarity_cache
+            )
+            temp_map_dfs.append(map_df)
 
-    # # start with unmapped functions
     assert pl.concat(func_map_dfs).filter(pl.col("old_fid").is_duplicated() | pl.col("new_fid").is_duplicated()).is_empty()
 
     df = (
         pl.concat(temp_map_dfs)
-        .join(old_func_info_remain_df, left_on="old_func", right_on="func")
-        .join(new_func_info_remain_df, left_on="new_func", right_on="func")
+        .join(old_func_info_df, left_on="old_func", right_on="func")
+        .join(new_func_info_df, left_on="new_func", right_on="func")
         .with_columns(
-            pl.struct(
-                funcname=(
-                    levenshtein_similarity_expr("namespace", "namespace_right") +
-                    levenshtein_similarity_expr("basename", "basename_right")
-                ),
-                parameters=levenshtein_similarity_expr("parameters", "parameters_right"),
-                extension=levenshtein_similarity_expr("extension", "extension_right"),
-                chunk=levenshtein_similarity_expr("chunk", "chunk_right"),
-                len=-1*(pl.col("old_func").str.len_chars().cast(int) - pl.col("new_func").str.len_chars()).abs()
-            ).alias("similarity")
+            func_similarity_expr(["funcname", "parameters", "extension", "chunk", "len"], similarity_cache)
+            .alias("similarity")
         )
     )
-
-    map_df = update_func_map(df)
-    old_func_info_df = old_func_info_df.join(map_df, left_on="fid", right_on="old_fid", how="anti")
-    new_func_info_df = new_func_info_df.join(map_df, left_on="fid", right_on="new_fid", how="anti")
-    func_map_dfs.append(map_df)
+    func_map_dfs.append(update_func_map(df))
 
     return (
         pl.concat(func_map_dfs)
@@ -428,8 +134,59 @@ def map_func_internal(old_func_info_df: pl.DataFrame, new_func_info_df: pl.DataF
         .unique()
     )
 
+FUNC_CROSS_MAX_PAIRS = 1 << 22
+FUNC_BLOCK_TOP_K = 16
+FUNC_BLOCK_MAX_POSTINGS = 256
+
+def name_grams(func_info_df: pl.DataFrame, s: str):
+    # trigrams of namespace and basename, tagged by field; names under three characters are one gram
+    return pl.concat(
+        func_info_df.select(pl.col("fid").alias(f"{s}_fid"), pl.col(col).fill_null("").alias("name"))
+        .with_columns(
+            pl.int_ranges(0, pl.max_horizontal(pl.col("name").str.len_chars() - 2, 1)).alias("start")
+        )
+        .explode("start")
+        .select(f"{s}_fid", (pl.lit(col + ":") + pl.col("name").str.slice("start", 3)).alias("gram"))
+        for col in ["namespace", "basename"]
+    ).unique()
+
+def block_func_pairs(old_func_info_df: pl.DataFrame, new_func_info_df: pl.DataFrame):
+    old_gram_df = name_grams(old_func_info_df, "old")
+    new_gram_df = name_grams(new_func_info_df, "new")
+    # grams shared by too many functions on either side say little and would blow up the join
+    gram_df = (
+        old_gram_df.group_by("gram").len("old_count")
+        .join(new_gram_df.group_by("gram").len("new_count"), on="gram")
+        .filter(
+            (pl.col("old_count") <= FUNC_BLOCK_MAX_POSTINGS) & 
+            (pl.col("new_count") <= FUNC_BLOCK_MAX_POSTINGS)
+        )
+        .select("gram")
+    )
+    shared_df = (
+        old_gram_df.join(gram_df, on="gram")
+        .join(new_gram_df, on="gram")
+        .group_by("old_fid", "new_fid").len("shared")
+    )
+    path_df = (
+        old_func_info_df.select(pl.col("fid").alias("old_fid"), "path").unique()
+        .join(new_func_info_df.select(pl.col("fid").alias("new_fid"), "path").unique(), on="path")
+        .select("old_fid", "new_fid")
+        .unique()
+        .join(shared_df, on=["old_fid", "new_fid"], how="left")
+        .with_columns(pl.col("shared").fill_null(0))
+    )
+
+    return pl.concat([
+        df.sort(f"{s}_fid", "shared", f"{o}_fid", descending=[False, True, False])
+        .group_by(f"{s}_fid", maintain_order=True).head(FUNC_BLOCK_TOP_K)
+        .select("old_fid", "new_fid")
+        for df, s, o in [(shared_df, "old", "new"), (shared_df, "new", "old"), (path_df, "old", "new")]
+    ]).unique()
+
 def map_func_by_debug(old_func_info_df: pl.DataFrame, new_func_info_df: pl.DataFrame,
-                      old_yaml_func_df: pl.DataFrame, try_all: bool = True):
+                      old_yaml_func_df: pl.DataFrame, try_all: bool = True,
+                      similarity_cache: SimilarityCache | None = None):
     
     # replace path of old with corresponding new path so that we can directly map
     old_func_info_df = replace_with_path(
@@ -437,13 +194,13 @@ def map_func_by_debug(old_func_info_df: pl.DataFrame, new_func_info_df: pl.DataF
         new_func_info_df.select("path").unique()
     )
 
-    func_map_df = map_func_internal(old_func_info_df, new_func_info_df, old_yaml_func_df)
+    func_map_df = map_func_internal(old_func_info_df, new_func_info_df, old_yaml_func_df, similarity_cache)
 
     while True:
         old_yaml_func_df = old_yaml_func_df.join(func_map_df, left_on="fid", right_on="old_fid", how="anti")
         old_func_info_df = old_func_info_df.join(old_yaml_func_df, on="fid", how="semi")
         new_func_info_df = new_func_info_df.join(func_map_df, left_on="fid", right_on="new_fid", how="anti")
-        map_df = map_func_internal(old_func_info_df, new_func_info_df, old_yaml_func_df)
+        map_df = map_func_internal(old_func_info_df, new_func_info_df, old_yaml_func_df, similarity_cache)
         if map_df.is_empty():
             break
         func_map_df.vstack(map_df, in_place=True)
@@ -452,21 +209,29 @@ def map_func_by_debug(old_func_info_df: pl.DataFrame, new_func_info_df: pl.DataF
         return func_map_df
     
     while True:
-        df = (
-            old_func_info_df.rename(lambda col: "old_" + col)
-            .join(new_func_info_df.rename(lambda col: "new_" + col), how="cross")
-            .with_columns(
-                pl.struct(
-                    funcname=(
-                        levenshtein_similarity_expr("old_namespace", "new_namespace") +
-                        levenshtein_similarity_expr("old_basename", "new_basename")
-                    ),
-                    parameters=levenshtein_similarity_expr("old_parameters", "new_parameters"),
-                    extension=levenshtein_similarity_expr("old_extension", "new_extension"),
-                    chunk=levenshtein_similarity_expr("old_chunk", "new_chunk"),
-                    len=-1*(pl.col("old_func").str.len_chars().cast(int) - pl.col("new_func").str.len_chars()).abs()
-                ).alias("similarity")
+        old_df = old_func_info_df.rename(lambda col: "old_" + col)
+        new_df = new_func_info_df.rename(lambda col: "new_" + col)
+        if len(old_df) * len(new_df) <= FUNC_CROSS_MAX_PAIRS:
+            df = old_df.join(new_df, how="cross")
+        else:
+            # only score name and path neighbours once the cross join gets too large to hold
+            df = (
+                block_func_pairs(old_func_info_df, new_func_info_df)
+                .join(old_df, on="old_fid")
+                .join(new_df, on="new_fid")
+                .select(*old_df.columns, *new_df.columns)
             )
+        df = df.with_columns(
+            pl.struct(
+                funcname=(
+                    levenshtein_similarity_expr("old_namespace", "new_namespace", similarity_cache) +
+                    levenshtein_similarity_expr("old_basename", "new_basename", similarity_cache)
+                ),
+                parameters=levenshtein_similarity_expr("old_parameters", "new_parameters", similarity_cache),
+                extension=levenshtein_similarity_expr("old_extension", "new_extension", similarity_cache),
+                chunk=levenshtein_similarity_expr("old_chunk", "new_chunk", similarity_cache),
+                len=-1*(pl.col("old_func").str.len_chars().cast(int) - pl.col("new_func").str.len_chars()).abs()
+            ).alias("similarity")
         )
         if df.is_empty():
             break
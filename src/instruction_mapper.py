@@ -1,89 +1,25 @@
+import multiprocessing
+import os
 import polars as pl
+from concurrent.futures import ProcessPoolExecutor
+from assignment import connected_components
 from utils import levenshtein_similarity_expr
 
+INS_WORKERS = os.cpu_count() or 1
+INS_POOL_MIN_ROWS = 1 << 20
+
 def process_ins(ins_df: pl.DataFrame):
     return  (
         ins_df
-        .with_columns(
-            pl.col("instruction")
-            .str.splitn("\t", 2)
-            .struct.rename_fields(["opcode", "operand"])
-        )
-        .unnest("instruction")
-        .with_columns(
-            pl.col("operand")
-            .str.replace(r"0x[0-9a-f]+\s<", "<")
-            .fill_null("")
-        )
         .select(
             "fid", "path", "line", "bid", 
             pl.col("address").rank("min").alias("index"), "opcode", "operand",
+            "jump_name", "jump_offset", "jump_fid",
         )
         .unique()
     )
 
-def map_ins(old_ins_df: pl.DataFrame, new_ins_df: pl.DataFrame, fsrc_map_df: pl.DataFrame):
-    old_ins_df = (
-        process_ins(old_ins_df)
-        .rename(lambda col: "old_" + col)
-        .with_columns(pl.col("old_opcode").str.slice(0,1).alias("oid"))
-    )
-    new_ins_df = (
-        process_ins(new_ins_df)
-        .rename(lambda col: "new_" + col)
-        .with_columns(pl.col("new_opcode").str.slice(0,1).alias("oid"))
-    )
-    
-    ins_match_df = (
-        old_ins_df
-        .join(fsrc_map_df, on=["old_fid", "old_path", "old_line"])
-        .join(new_ins_df, on=["new_fid", "new_path", "new_line", "oid"])
-        .with_columns(
-            levenshtein_similarity_expr("old_opcode", "new_opcode")
-            .round(10)
-            .alias("opcode_match_score")
-        )
-        .filter(
-            pl.col("opcode_match_score").max()
-            .over("old_path", "old_line", "new_path", "new_line", "old_index")
-            .eq(pl.col("opcode_match_score")) |
-            pl.col("opcode_match_score").max()
-            .over("old_path", "old_line", "new_path", "new_line", "new_index")
-            .eq(pl.col("opcode_match_score"))
-        )
-        .with_columns(
-            pl.when(pl.col("oid") == "j")
-            .then(
-                pl.col("old_operand")
-                .str.extract_groups(r"<(.+)\+0x([0-9a-f]+)>")
-                .struct.rename_fields(["old_jump_name", "old_jump_offset"])
-            )
-            .alias("old_jump"),
-            pl.when(pl.col("oid") == "j")
-            .then(
-                pl.col("new_operand")
-                .str.extract_groups(r"<(.+)\+0x([0-9a-f]+)>")
-                .struct.rename_fields(["new_jump_name", "new_jump_offset"])
-            )
-            .alias("new_jump"),
-        )
-        .unnest("old_jump", "new_jump")
-        .with_columns(
-            levenshtein_similarity_expr("old_jump_name", "new_jump_name")
-            .round(10)
-            .alias("jump_func_score"),
-            (
-                pl.col("old_jump_offset").str.to_integer(base=16) - 
-                pl.col("new_jump_offset").str.to_integer(base=16)
-            ).abs().neg()
-            .alias("jump_diff_score"),
-            levenshtein_similarity_expr("old_operand", "new_operand")
-            .round(10)
-            .alias("operand_match_score"),
-        )
-        .with_columns(pl.col("jump_func_score") + pl.col("opcode_match_score"))
-    )
-
+def select_ins_map(ins_match_df: pl.DataFrame):
     ins_map_df = pl.DataFrame(
         schema=ins_match_df.select(
             "old_fid", "old_bid", "old_index", 
@@ -151,3 +87,99 @@ def map_ins(old_ins_df: pl.DataFrame, new_ins_df: pl.DataFrame, fsrc_map_df: pl.
         )
 
     return ins_map_df
+
+def intern_opcodes(old_ins_df: pl.DataFrame, new_ins_df: pl.DataFrame):
+    # a few hundred mnemonics: score every vocabulary pair once, row-major by opcode id
+    vocab = pl.concat([old_ins_df["opcode"], new_ins_df["opcode"]]).unique().drop_nulls().sort()
+    vocab_df = pl.DataFrame({"opcode": vocab})
+    opcode_similarity = (
+        vocab_df
+        .join(vocab_df, how="cross")
+        .sort("opcode", "opcode_right")
+        .select(levenshtein_similarity_expr("opcode", "opcode_right").round(10))
+        .to_series()
+    )
+    # the first letter groups mnemonics of one family (j* jumps, mov*, ...)
+    opcode_class = pl.Series([ord(opcode[:1] or "\0") for opcode in vocab], dtype=pl.UInt32)
+    return pl.Enum(vocab), opcode_similarity, opcode_class
+
+def map_ins(old_ins_df: pl.DataFrame, new_ins_df: pl.DataFrame, fsrc_map_df: pl.DataFrame,
+            func_map_df: pl.DataFrame):
+    old_ins_df = process_ins(old_ins_df)
+    new_ins_df = process_ins(new_ins_df)
+    opcode_type, opcode_similarity, opcode_class = intern_opcodes(old_ins_df, new_ins_df)
+    old_ins_df = (
+        old_ins_df
+        .with_columns(pl.col("opcode").cast(opcode_type).to_physical().cast(pl.Int64))
+        .rename(lambda col: "old_" + col)
+        .with_columns(pl.lit(opcode_class).gather(pl.col("old_opcode")).alias("oid"))
+    )
+    new_ins_df = (
+        new_ins_df
+        .with_columns(pl.col("opcode").cast(opcode_type).to_physical().cast(pl.Int64))
+        .rename(lambda col: "new_" + col)
+        .with_columns(pl.lit(opcode_class).gather(pl.col("new_opcode")).alias("oid"))
+    )
+    
+    ins_match_df = (
+        old_ins_df
+        .join(fsrc_map_df, on=["old_fid", "old_path", "old_line"])
+        .join(new_ins_df, on=["new_fid", "new_path", "new_line", "oid"])
+        .with_columns(
+            pl.lit(opcode_similarity)
+            .gather(pl.col("old_opcode") * len(opcode_class) + pl.col("new_opcode"))
+            .alias("opcode_match_score")
+        )
+        .filter(
+            pl.col("opcode_match_score").max()
+            .over("old_path", "old_line", "new_path", "new_line", "old_index")
+            .eq(pl.col("opcode_match_score")) |
+            pl.col("opcode_match_score").max()
+            .over("old_path", "old_line", "new_path", "new_line", "new_index")
+            .eq(pl.col("opcode_match_score"))
+        )
+        # a jump into an already mapped function is scored by where that function went, as long
+        # as the new target resolves to a single function; aliases can map one function to several
+        .join(
+            func_map_df
+            .group_by(pl.col("old_fid").alias("old_jump_fid"))
+            .agg(pl.col("new_fid").unique().alias("mapped_jump_fids")),
+            on="old_jump_fid", how="left",
+        )
+        .with_columns(
+            pl.when(pl.col("oid") == ord("j"))
+            .then(
+                pl.when(pl.col("mapped_jump_fids").is_not_null() & pl.col("new_jump_fid").is_not_null())
+                .then(pl.col("mapped_jump_fids").list.contains(pl.col("new_jump_fid")).cast(pl.Float64))
+                .otherwise(levenshtein_similarity_expr("old_jump_name", "new_jump_name").round(10))
+            )
+            .alias("jump_func_score"),
+            pl.when(pl.col("oid") == ord("j"))
+            .then((pl.col("old_jump_offset") - pl.col("new_jump_offset")).abs().neg())
+            .alias("jump_diff_score"),
+            levenshtein_similarity_expr("old_operand", "new_operand")
+            .round(10)
+            .alias("operand_match_score"),
+        )
+        .with_columns(pl.col("jump_func_score") + pl.col("opcode_match_score"))
+    )
+
+    if INS_WORKERS == 1 or ins_match_df.height < INS_POOL_MIN_ROWS:
+        return select_ins_map(ins_match_df)
+
+    # candidate rows only interact within a connected group of function pairs
+    pair_df = ins_match_df.select("old_fid", "new_fid").unique()
+    pair_df = pair_df.with_columns(
+        pl.Series("batch", connected_components(pair_df["old_fid"].to_list(), pair_df["new_fid"].to_list()))
+        .hash() % (4 * INS_WORKERS)
+    )
+    batch_dfs = (
+        ins_match_df
+        .join(pair_df, on=["old_fid", "new_fid"])
+        .partition_by("batch", include_key=False)
+    )
+    # no batches to concat, or a single one not worth a pool
+    if len(batch_dfs) < 2:
+        return select_ins_map(ins_match_df)
+    with ProcessPoolExecutor(INS_WORKERS, mp_context=multiprocessing.get_context("spawn")) as pool:
+        return pl.concat(pool.map(select_ins_map, batch_dfs))
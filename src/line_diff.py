@@ -0,0 +1,78 @@
+import bisect
+import multiprocessing
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+DIFF_WORKERS = os.cpu_count() or 1
+DIFF_POOL_MIN_LINES = 1 << 18
+
+def longest_increasing(pairs: list[tuple[int, int]]):
+    # patience sorting over the second index of pairs already ordered by the first
+    tails: list[int] = []
+    tail_pairs: list[int] = []
+    prev = [-1] * len(pairs)
+    for k, (_, j) in enumerate(pairs):
+        pos = bisect.bisect_left(tails, j)
+        if pos > 0:
+            prev[k] = tail_pairs[pos - 1]
+        if pos == len(tails):
+            tails.append(j)
+            tail_pairs.append(k)
+        else:
+            tails[pos] = j
+            tail_pairs[pos] = k
+
+    lis = []
+    k = tail_pairs[-1] if tail_pairs else -1
+    while k >= 0:
+        lis.append(pairs[k])
+        k = prev[k]
+    return lis[::-1]
+
+def patience_diff(old_keys: list[int], new_keys: list[int]):
+    old_index, new_index = [], []
+    ranges = [(0, len(old_keys), 0, len(new_keys))]
+    while ranges:
+        old_lo, old_hi, new_lo, new_hi = ranges.pop()
+        while old_lo < old_hi and new_lo < new_hi and old_keys[old_lo] == new_keys[new_lo]:
+            old_index.append(old_lo)
+            new_index.append(new_lo)
+            old_lo += 1
+            new_lo += 1
+        while old_lo < old_hi and new_lo < new_hi and old_keys[old_hi - 1] == new_keys[new_hi - 1]:
+            old_hi -= 1
+            new_hi -= 1
+            old_index.append(old_hi)
+            new_index.append(new_hi)
+        if old_lo >= old_hi or new_lo >= new_hi:
+            continue
+
+        old_count = Counter(old_keys[old_lo:old_hi])
+        new_count = Counter(new_keys[new_lo:new_hi])
+        new_unique = {
+            key: j for j, key in enumerate(new_keys[new_lo:new_hi], new_lo) if new_count[key] == 1
+        }
+        pairs = [
+            (i, new_unique[key]) for i, key in enumerate(old_keys[old_lo:old_hi], old_lo)
+            if old_count[key] == 1 and key in new_unique
+        ]
+
+        # anchor on the longest monotone run of unique lines and diff the gaps between them
+        for i, j in longest_increasing(pairs):
+            old_index.append(i)
+            new_index.append(j)
+            ranges.append((old_lo, i, new_lo, j))
+            old_lo, new_lo = i + 1, j + 1
+        if pairs:
+            ranges.append((old_lo, old_hi, new_lo, new_hi))
+    return old_index, new_index
+
+def diff_all(old_key_lists: list[list[int]], new_key_lists: list[list[int]]):
+    if DIFF_WORKERS == 1 or sum(map(len, old_key_lists)) < DIFF_POOL_MIN_LINES:
+        return list(map(patience_diff, old_key_lists, new_key_lists))
+    with ProcessPoolExecutor(DIFF_WORKERS, mp_context=multiprocessing.get_context("spawn")) as pool:
+        return list(pool.map(
+            patience_diff, old_key_lists, new_key_lists,
+            chunksize=max(1, len(old_key_lists) // (4 * DIFF_WORKERS)),
+        ))
@@ -1,79 +1,139 @@
 import polars as pl
-import polars_ds as pds
+from utils import levenshtein_similarity_expr
 
-def map_path_by_name(old_path_df: pl.DataFrame, new_path_df: pl.DataFrame):
-    old_names_df = (
-        old_path_df
-        .with_columns(pl.col("path").str.split("/").list.reverse().alias("name"))
-        .with_columns(pl.int_ranges(0, pl.col("name").list.len()).alias("index"))
-        .explode("name", "index")
-    )
+def suffix_trie(paths):
+    # reversed-component trie; a node is [children, path count, first path, path ending here]
+    root = [{}, 0, None, None]
+    for path in paths:
+        node = root
+        for name in reversed(path.split("/")):
+            node = node[0].setdefault(name, [{}, 0, path, None])
+            node[1] += 1
+        node[3] = path
+    return root
 
-    new_names_df = (
-        new_path_df
-        .with_columns(pl.col("path").str.split("/").list.reverse().alias("name"))
-        .with_columns(pl.int_ranges(0, pl.col("name").list.len()).alias("index"))
-        .explode("name", "index")
-    )
+def trie_paths(node):
+    paths, stack = [], [node]
+    while stack:
+        node = stack.pop()
+        if node[3] is not None:
+            paths.append(node[3])
+        stack.extend(node[0].values())
+    return paths
 
-    i = 0
-    match_df = (
-        old_names_df.filter(pl.col("index") == i)
-        .join(new_names_df.filter(pl.col("index") == i), on="name")
-        .select("path", "path_right")
-    )
+class PathResolver:
+    # resolves paths against one path set; answers are kept so each distinct name is resolved once
+    def __init__(self, path_df: pl.DataFrame):
+        # line-info rows without a file carry a null path, which never resolves
+        self.root = suffix_trie(path_df["path"].drop_nulls().unique().to_list())
+        self.resolved: dict[str, str | None] = {}
+
+    def resolve(self, paths: list[str]):
+        ambiguous = {}
+        for path in paths:
+            node = self.root
+            for name in reversed(path.split("/")):
+                child = node[0].get(name)
+                if child is None:
+                    break
+                node = child
+                if node[1] == 1:
+                    break
+            if node is self.root:
+                self.resolved[path] = None
+            elif node[1] == 1:
+                self.resolved[path] = node[2]
+            else:
+                ambiguous[path] = trie_paths(node)
 
-    path_map_df = match_df.sample(0)
+        if ambiguous:
+            # the longest shared suffix is still ambiguous; fall back to whole-path similarity
+            self.resolved.update(
+                pl.DataFrame(
+                    {"path": list(ambiguous), "path_right": list(ambiguous.values())},
+                    schema={"path": pl.String, "path_right": pl.List(pl.String)},
+                )
+                .explode("path_right")
+                .with_columns(levenshtein_similarity_expr("path", "path_right").alias("similarity"))
+                .filter(pl.col("similarity").max().over("path").eq(pl.col("similarity")))
+                .sort("path", "path_right")
+                .group_by("path", maintain_order=True).first()
+                .select("path", "path_right")
+                .iter_rows()
+            )
 
-    while not match_df.is_empty():
-        match_dfs = (
-            match_df
-            .with_columns(is_unique=pl.col("path").is_unique())
-            .partition_by("is_unique", as_dict=True, include_key=False)
+    def map(self, path_df: pl.DataFrame):
+        paths = path_df["path"].drop_nulls().unique().to_list()
+        self.resolve([path for path in paths if path not in self.resolved])
+        mapped = [(path, self.resolved[path]) for path in paths if self.resolved[path] is not None]
+        return pl.DataFrame(
+            {"old_path": [old for old, _ in mapped], "new_path": [new for _, new in mapped]},
+            schema={"old_path": pl.String, "new_path": pl.String},
         )
 
-        if (True,) in match_dfs:
-            path_map_df.vstack(match_dfs[True,], in_place=True)
-        if (False,) in match_dfs:
-            i += 1
-            match_dfs = (
-                match_dfs[False,]
-                .join(old_names_df.filter(pl.col("index") == i), on="path", how="left")
-                .join(
-                    new_names_df.filter(pl.col("index") == i), 
-                    left_on=["path_right", "name"], 
-                    right_on=["path", "name"],
-                    how="left",
-                )
-                .with_columns(pl.col("index_right").is_null().all().over("path"))
-                .partition_by("index_right", as_dict=True, include_key=False)
+    def replace(self, df: pl.DataFrame, col: str):
+        return (
+            df.join(
+                self.map(df.select(pl.col(col).alias("path"))),
+                left_on=col, right_on="old_path", how="left",
             )
-            if (True,) in match_dfs:
-                path_map_df.vstack(
-                    match_dfs[True,]
-                    .with_columns(pds.str_leven("path", "path_right", True, True).alias("similarity"))
-                    .filter(pl.col("similarity").max().over("path").eq(pl.col("similarity")))
-                    .group_by("path").first()
-                    .select("path", "path_right"),
-                    in_place=True
-                )
-            if (False,) in match_dfs:
-                match_df = match_dfs[False,].select("path", "path_right")
-            else:
-                break
-        else:
-            break
+            .with_columns(pl.col("new_path").fill_null(pl.col(col)))
+            .drop(col)
+            .rename({"new_path": "path"})
+        )
+
+def map_path_by_name(old_path_df: pl.DataFrame, new_path_df: pl.DataFrame):
+    return PathResolver(new_path_df).map(old_path_df)
 
-    return path_map_df.rename({"path": "old_path", "path_right": "new_path"})
+MINHASH_BANDS = 16
+MINHASH_ROWS = 2
 
-def map_path_by_match(old_src_df: pl.DataFrame, new_src_df: pl.DataFrame):
+def minhash_bands(src_df: pl.DataFrame):
+    # one bucket key per band of MinHash values over the distinct line keys of each file
     return (
+        src_df.group_by("path")
+        .agg(
+            pl.col("code_key").hash(seed=i).min().alias(f"minhash_{i}")
+            for i in range(MINHASH_BANDS * MINHASH_ROWS)
+        )
+        .select(
+            "path",
+            *(
+                pl.struct(
+                    pl.lit(band, pl.UInt32).alias("band"),
+                    pl.struct(
+                        f"minhash_{band * MINHASH_ROWS + j}" for j in range(MINHASH_ROWS)
+                    ).hash().alias("bucket"),
+                ).alias(f"band_{band}")
+                for band in range(MINHASH_BANDS)
+            ),
+        )
+        .unpivot(index="path", value_name="band")
+        .select("path", pl.col("band").struct.unnest())
+    )
+
+def map_path_by_match(old_src_df: pl.DataFrame, new_src_df: pl.DataFrame):
+    old_src_df = (
         old_src_df.filter(~pl.col("code").str.contains(r"^\s*#|^\s*[\{\}]$"))
-        .with_columns(pl.col("line").rank("min").over(["path", "code"]).alias("rank"))
+        .with_columns(pl.col("line").rank("min").over(["path", "code_key"]).alias("rank"))
+    )
+    new_src_df = (
+        new_src_df.filter(~pl.col("code").str.contains(r"^\s*#|^\s*[\{\}]$"))
+        .with_columns(pl.col("line").rank("min").over(["path", "code_key"]).alias("rank"))
+    )
+    # only file pairs sharing a MinHash band are scored line by line
+    pair_df = (
+        minhash_bands(old_src_df)
+        .join(minhash_bands(new_src_df), on=["band", "bucket"])
+        .select("path", "path_right")
+        .unique()
+    )
+    return (
+        old_src_df.join(pair_df, on="path")
         .join(
-            new_src_df.filter(~pl.col("code").str.contains(r"^\s*#|^\s*[\{\}]$"))
-            .with_columns(pl.col("line").rank("min").over(["path", "code"]).alias("rank")), 
-            on=["code", "rank"])
+            new_src_df.rename({"path": "path_right"}),
+            on=["path_right", "code_key", "rank"],
+        )
         .group_by("path", "path_right")
         .agg(pl.col("code").str.len_chars().sum().alias("len"))
         .filter(
@@ -86,16 +146,6 @@ def map_path_by_match(old_src_df: pl.DataFrame, new_src_df: pl.DataFrame):
         .rename({"path": "old_path", "path_right": "new_path"})
     )
 
-def replace_with_path(df: pl.DataFrame, col: str, path_df: pl.DataFrame):
-    return (
-        df.join(
-            map_path_by_name(
-                df.select(pl.col(col).alias("path")).unique(), 
-                path_df
-            ),
-            left_on=col, right_on="old_path", how="left",
-        )
-        .with_columns(pl.col("new_path").fill_null(pl.col(col)))
-        .drop(col)
-        .rename({"new_path": "path"})
-    )
\ No newline at end of file
+def replace_with_path(df: pl.DataFrame, col: str, path_df: pl.DataFrame | PathResolver):
+    resolver = path_df if isinstance(path_df, PathResolver) else PathResolver(path_df)
+    return resolver.replace(df, col)
@@ -1,7 +1,8 @@
 import polars as pl
 import polars.selectors as cs
-import polars_ds as pds
 from path_mapper import map_path_by_name, map_path_by_match
+from line_diff import diff_all
+from utils import levenshtein_similarity_expr, filter_similarity, SimilarityCache
 
 def tight_bound_src(src_df: pl.DataFrame, s: str, o: str, src_map_df: pl.DataFrame):
     return (
@@ -91,17 +92,18 @@ def loose_bound_src(src_df: pl.DataFrame, s: str, o: str, src_map_df: pl.DataFra
 
 def map_src_exact_unique(old_src_df: pl.DataFrame, new_src_df: pl.DataFrame, 
                          path_map_df: pl.DataFrame):
+    key = "code_key"
     src_map_df = (
         path_map_df
         .join(
-            old_src_df.filter(pl.struct("path", "code").is_unique())
+            old_src_df.filter(pl.struct("path", key).is_unique())
             .rename({"path": "old_path", "line": "old_line"}), 
             on="old_path",
         )
         .join(
-            new_src_df.filter(pl.struct("path", "code").is_unique())
+            new_src_df.filter(pl.struct("path", key).is_unique())
             .rename({"path": "new_path", "line": "new_line"}), 
-            on=["new_path", "code"], 
+            on=["new_path", key], 
         )
         .select("old_path", "old_line", "new_path", "new_line")
         .filter(
@@ -132,8 +134,8 @@ def map_src_exact_unique(old_src_df: pl.DataFrame, new_src_df: pl.DataFrame,
             )
             .filter(pl.col("path_self").is_null())
             .drop("path_self")
-            .filter(pl.struct("path", "code").is_unique())
-            .rename(lambda col: ("old_" + col) if col != "code" else col), 
+            .filter(pl.struct("path", key).is_unique())
+            .rename(lambda col: ("old_" + col) if col != key else col), 
             on="old_path",
         ).join(
             new_src_df
@@ -155,9 +157,9 @@ def map_src_exact_unique(old_src_df: pl.DataFrame, new_src_df: pl.DataFrame,
             )
             .filter(pl.col("path_self").is_null())
             .drop("path_self")
-            .filter(pl.struct("path", "code").is_unique())
-            .rename(lambda col: ("new_" + col) if col != "code" else col),
-            on=["new_path", "code"], 
+            .filter(pl.struct("path", key).is_unique())
+            .rename(lambda col: ("new_" + col) if col != key else col),
+            on=["new_path", key], 
         ).filter(
             pl.col("old_line").is_between("new_line_prev", "new_line_next", closed="none") &
             pl.col("new_line").is_between("old_line_prev", "old_line_next", closed="none")
@@ -171,8 +173,7 @@ def map_src_exact_unique(old_src_df: pl.DataFrame, new_src_df: pl.DataFrame,
         if temp_map_df.is_empty():
             if removed_comments:
                 break
-            old_src_df = old_src_df.with_columns(pl.col("code").str.replace(r"//.*$", ""))
-            new_src_df = new_src_df.with_columns(pl.col("code").str.replace(r"//.*$", ""))
+            key = "bare_key"
             removed_comments = True
 
         src_map_df.vstack(temp_map_df, in_place=True)
@@ -219,14 +220,14 @@ def bound_rank_src(src_map_df: pl.DataFrame, src_df: pl.DataFrame, s: str, o: st
             pl.col(f"{o}_line_prev").lt(pl.col(f"{o}_line_next"))
         )
         .select(
-            f"{s}_path", f"{s}_line", "code",
+            f"{s}_path", f"{s}_line", "code_key", "bare_key",
             pl.col(f"{o}_path_prev").alias(f"{o}_path"),
             f"{o}_line_prev", f"{o}_line_next",
         )
         .with_columns(
-            pl.col(f"{s}_line").rank("min", descending=False).over([f"{s}_path", "code", f"{o}_line_prev"]).alias("rank_inc"),
-            pl.col(f"{s}_line").rank("min", descending=True).over([f"{s}_path", "code", f"{o}_line_prev"]).alias("rank_dec"),
-            pl.col(f"{s}_line").count().over([f"{s}_path", "code", f"{o}_line_prev"]).alias("rank_count"),
+            pl.col(f"{s}_line").rank("min", descending=False).over([f"{s}_path", "code_key", f"{o}_line_prev"]).alias("rank_inc"),
+            pl.col(f"{s}_line").rank("min", descending=True).over([f"{s}_path", "code_key", f"{o}_line_prev"]).alias("rank_dec"),
+            pl.col(f"{s}_line").count().over([f"{s}_path", "code_key", f"{o}_line_prev"]).alias("rank_count"),
         )
     )
 
@@ -262,10 +263,11 @@ def map_src_exact_duplicate_bound(old_src_df: pl.DataFrame, new_src_df: pl.DataF
     old_bnd_df = bound_rank_src(src_map_df, old_src_df, "old", "new")
     new_bnd_df = bound_rank_src(src_map_df, new_src_df, "new", "old")
 
+    key = "code_key"
     removed_comments = False
     while True:
         src_map_df = bound_unique(
-            old_bnd_df.join(new_bnd_df, on=["old_path", "new_path", "code", "rank_count", "rank_inc"])
+            old_bnd_df.join(new_bnd_df, on=["old_path", "new_path", key, "rank_count", "rank_inc"])
         )
 
         if not src_map_df.is_empty():
@@ -276,14 +278,14 @@ def map_src_exact_duplicate_bound(old_src_df: pl.DataFrame, new_src_df: pl.DataF
                 old_bnd_df.filter(pl.col("rank_inc") == 1)
                 .join(
                     new_bnd_df.filter(pl.col("rank_inc") == 1), 
-                    on=["old_path", "new_path", "code", "rank_inc"],
+                    on=["old_path", "new_path", key, "rank_inc"],
                 )
             ),
             bound_unique(
                 old_bnd_df.filter((pl.col("rank_inc") != 1) & (pl.col("rank_dec") == 1))
                 .join(
                     new_bnd_df.filter((pl.col("rank_inc") != 1) & (pl.col("rank_dec") == 1)), 
-                    on=["old_path", "new_path", "code", "rank_dec"],
+                    on=["old_path", "new_path", key, "rank_dec"],
                 )
             )
         ])
@@ -294,46 +296,52 @@ def map_src_exact_duplicate_bound(old_src_df: pl.DataFrame, new_src_df: pl.DataF
         if removed_comments:
             break
         
-        old_bnd_df = old_bnd_df.with_columns(pl.col("code").str.replace(r"//.*$", ""))
-        new_bnd_df = new_bnd_df.with_columns(pl.col("code").str.replace(r"//.*$", ""))
+        key = "bare_key"
         removed_comments = True
 
     return src_map_df
 
+def with_tokens(bnd_df: pl.DataFrame):
+    # hashed words of the comment-stripped line, only for the rows left inside the bounds
+    words = (
+        pl.col("code").str.replace(r"//.*$", "")
+        .str.strip_chars().str.replace_all(r"\s+", " ").str.split(" ")
+    )
+    return bnd_df.with_columns(
+        words.list.eval(pl.element().hash()).alias("tokens"),
+        words.list.eval(pl.element().str.len_chars()).alias("token_lens"),
+    )
+
 def map_src_exact_word_bound(old_src_df: pl.DataFrame, new_src_df: pl.DataFrame, src_map_df: pl.DataFrame):
-    old_bnd_df = tight_bound_src(old_src_df, "old", "new", src_map_df)
-    new_bnd_df = tight_bound_src(new_src_df, "new", "old", src_map_df)
+    old_bnd_df = with_tokens(tight_bound_src(old_src_df, "old", "new", src_map_df))
+    new_bnd_df = with_tokens(tight_bound_src(new_src_df, "new", "old", src_map_df))
 
     map_df = src_map_df.sample(0)
 
     match_df = (
         old_bnd_df.lazy()
-        .with_columns(pl.col("code").str.replace(r"//.*$", ""))
         .with_columns(
-            pl.col("code").str.strip_chars()
-            .str.replace_all(r"\s+", " ")
-            .str.split(" ").alias("word"))
-        .with_columns(pl.int_ranges(0, pl.col("word").list.len()).alias("index"))
-        .explode("word", "index")
-        .with_columns(pl.col("index").rank("min").over("old_path", "old_line", "word"))
+            pl.col("code").str.replace(r"//.*$", ""),
+            pl.int_ranges(0, pl.col("tokens").list.len()).alias("index"),
+        )
+        .explode("tokens", "token_lens", "index")
+        .with_columns(pl.col("index").rank("min").over("old_path", "old_line", "tokens"))
     ).join(
         new_bnd_df.lazy()
-        .with_columns(pl.col("code").str.replace(r"//.*$", ""))
         .with_columns(
-            pl.col("code").str.strip_chars()
-            .str.replace_all(r"\s+", " ")
-            .str.split(" ").alias("word"))
-        .with_columns(pl.int_ranges(0, pl.col("word").list.len()).alias("index"))
-        .explode("word", "index")
-        .with_columns(pl.col("index").rank("min").over("new_path", "new_line", "word")),
-        on=["old_path", "new_path", "word", "index"]
+            pl.col("code").str.replace(r"//.*$", ""),
+            pl.int_ranges(0, pl.col("tokens").list.len()).alias("index"),
+        )
+        .explode("tokens", "token_lens", "index")
+        .with_columns(pl.col("index").rank("min").over("new_path", "new_line", "tokens")),
+        on=["old_path", "new_path", "tokens", "index"]
     ).filter(
         pl.col("old_line").is_between("old_line_prev", "old_line_next", closed="none") &
         pl.col("new_line").is_between("new_line_prev", "new_line_next", closed="none")
     ).group_by(
         "old_path", "old_line", "new_path", "new_line", "code", "code_right"
     ).agg(
-        (pl.col("word").str.len_chars() / 
+        (pl.col("token_lens") / 
         pl.max_horizontal(pl.col("code").str.len_chars(), pl.col("code_right").str.len_chars())
         ).sum().alias("len")
     ).collect()
@@ -356,7 +364,7 @@ def map_src_exact_word_bound(old_src_df: pl.DataFrame, new_src_df: pl.DataFrame,
         )
     
     match_df = match_df.with_columns(
-        pds.str_leven("code", "code_right", True, True).alias("similarity")
+        levenshtein_similarity_expr("code", "code_right").alias("similarity")
     )
     
     while True:
@@ -400,7 +408,7 @@ def map_src_fuzzy_tight_bound(old_src_df: pl.DataFrame, new_src_df: pl.DataFrame
             pl.col("new_line").is_between("new_line_prev", "new_line_next", closed="none")
         )
         .with_columns(
-            pds.str_leven("code", "code_right", True, True).alias("similarity")
+            levenshtein_similarity_expr("code", "code_right").alias("similarity")
         )
         .filter(
             pl.col("similarity").max().over("old_path", "old_line")
@@ -434,20 +442,91 @@ def map_src_fuzzy_tight_bound(old_src_df: pl.DataFrame, new_src_df: pl.DataFrame
         .collect()
     )
 
+def map_src_identical(old_src_df: pl.DataFrame, path_map_df: pl.DataFrame,
+                      old_content_df: pl.DataFrame, new_content_df: pl.DataFrame):
+    same_path_df = (
+        path_map_df
+        .join(old_content_df.rename({"path": "old_path"}), on="old_path")
+        .join(new_content_df.rename({"path": "new_path"}), on=["new_path", "content"])
+        .filter(pl.col("old_path").is_unique() & pl.col("new_path").is_unique())
+        .select("old_path", "new_path")
+    )
+    src_map_df = (
+        same_path_df
+        .join(
+            old_src_df.select(pl.col("path").alias("old_path"), pl.col("line").alias("old_line")),
+            on="old_path",
+        )
+        .select("old_path", "old_line", "new_path", pl.col("old_line").alias("new_line"))
+    )
+    return same_path_df, src_map_df
+
+def map_src_diff(old_src_df: pl.DataFrame, new_src_df: pl.DataFrame, path_map_df: pl.DataFrame):
+    def keyed(src_df: pl.DataFrame, s: str):
+        return (
+            src_df.sort("path", "line")
+            .group_by("path", maintain_order=True)
+            .agg(pl.col("line").alias(f"{s}_lines"), pl.col("code_key").alias(f"{s}_keys"))
+            .rename({"path": f"{s}_path"})
+        )
+
+    pair_df = (
+        path_map_df
+        .join(keyed(old_src_df, "old"), on="old_path")
+        .join(keyed(new_src_df, "new"), on="new_path")
+    )
+    old_index, new_index = zip(*diff_all(
+        pair_df["old_keys"].to_list(), pair_df["new_keys"].to_list()
+    )) if not pair_df.is_empty() else ((), ())
+
+    return (
+        pair_df
+        .with_columns(
+            pl.Series("old_index", old_index, dtype=pl.List(pl.UInt32)),
+            pl.Series("new_index", new_index, dtype=pl.List(pl.UInt32)),
+        )
+        .select(
+            "old_path", pl.col("old_lines").list.gather("old_index").alias("old_line"),
+            "new_path", pl.col("new_lines").list.gather("new_index").alias("new_line"),
+        )
+        .explode("old_line", "new_line")
+        .drop_nulls("old_line")
+    )
+
 def map_src(old_src_df: pl.DataFrame, new_src_df: pl.DataFrame,
-            old_line_df: pl.DataFrame, new_line_df: pl.DataFrame):
+            old_line_df: pl.DataFrame, new_line_df: pl.DataFrame,
+            old_content_df: pl.DataFrame | None = None, 
+            new_content_df: pl.DataFrame | None = None):
     path_map_df = map_path_by_name(
         old_src_df.select("path").unique(), 
         new_src_df.select("path").unique(),
     )
 
-    t_old_src_df = old_src_df
-    t_new_src_df = new_src_df
-
     src_map_df = pl.DataFrame(
         schema={"old_path": str, "old_line": int, "new_path": str, "new_line": int}
     )
-    path_used = False
+
+    # byte-identical file pairs map line for line and skip every matching stage below
+    if old_content_df is not None and new_content_df is not None:
+        same_path_df, temp_map_df = map_src_identical(
+            old_src_df, path_map_df, old_content_df, new_content_df
+        )
+        src_map_df.vstack(temp_map_df, in_place=True)
+        path_map_df = (
+            path_map_df
+            .join(same_path_df, on="old_path", how="anti")
+            .join(same_path_df, on="new_path", how="anti")
+        )
+        old_src_df = old_src_df.join(same_path_df, left_on="path", right_on="old_path", how="anti")
+        new_src_df = new_src_df.join(same_path_df, left_on="path", right_on="new_path", how="anti")
+
+    # anchor each file pair on a patience diff; the stages below only fill the gaps
+    temp_map_df = map_src_diff(old_src_df, new_src_df, path_map_df)
+    src_map_df.vstack(temp_map_df, in_place=True)
+    path_used = not temp_map_df.is_empty()
+
+    t_old_src_df = old_src_df
+    t_new_src_df = new_src_df
 
     while True:
         t_old_src_df = t_old_src_df.join(
@@ -533,23 +612,23 @@ def map_src(old_src_df: pl.DataFrame, new_src_df: pl.DataFrame,
 
 def map_src_with_func(old_fsrc_df: pl.DataFrame, new_fsrc_df: pl.DataFrame, 
                        func_map_df: pl.DataFrame, src_map_df: pl.DataFrame,
-                       map_remaining: bool):
+                       map_remaining: bool, similarity_cache: SimilarityCache | None = None):
     temp_map_df = src_map_df.sample(0)
     while True:
         src_map_df.vstack(temp_map_df, in_place=True)
 
         old_bnd_df = tight_bound_src(
-            old_fsrc_df.select("path", "line", "code").unique(), 
+            old_fsrc_df.select("path", "line", "code", "code_key").unique(), 
             "old", "new",
             src_map_df, 
         )
         new_bnd_df = tight_bound_src(
-            new_fsrc_df.select("path", "line", "code").unique(),
+            new_fsrc_df.select("path", "line", "code", "code_key").unique(),
             "new", "old",
             src_map_df, 
         )
         temp_map_df = (
-            old_bnd_df.join(new_bnd_df, on=["old_path", "new_path", "code"])
+            old_bnd_df.join(new_bnd_df, on=["old_path", "new_path", "code_key"])
             .filter(
                 pl.col("old_line").is_between("old_line_prev", "old_line_next", closed="none") &
                 pl.col("new_line").is_between("new_line_prev", "new_line_next", closed="none")
@@ -564,17 +643,17 @@ def map_src_with_func(old_fsrc_df: pl.DataFrame, new_fsrc_df: pl.DataFrame,
             continue
 
         old_bnd_df = loose_bound_src(
-            old_fsrc_df.select("path", "line", "code").unique(), 
+            old_fsrc_df.select("path", "line", "code", "code_key").unique(), 
             "old", "new",
             src_map_df, 
         )
         new_bnd_df = loose_bound_src(
-            new_fsrc_df.select("path", "line", "code").unique(),
+            new_fsrc_df.select("path", "line", "code", "code_key").unique(),
             "new", "old",
             src_map_df, 
         )
         temp_map_df = (
-            old_bnd_df.join(new_bnd_df, on=["old_path", "new_path", "code"])
+            old_bnd_df.join(new_bnd_df, on=["old_path", "new_path", "code_key"])
             .filter(
                 pl.col("old_line").is_between("old_line_prev", "old_line_next", closed="none") &
                 pl.col("new_line").is_between("new_line_prev", "new_line_next", closed="none")
@@ -590,7 +669,7 @@ def map_src_with_func(old_fsrc_df: pl.DataFrame, new_fsrc_df: pl.DataFrame,
             continue
 
         temp_map_df = (
-            old_bnd_df.join(new_bnd_df, on=["old_path", "new_path", "code"])
+            old_bnd_df.join(new_bnd_df, on=["old_path", "new_path", "code_key"])
             .select(src_map_df.columns)
             .unique()
             .filter(
@@ -617,7 +696,7 @@ def map_src_with_func(old_fsrc_df: pl.DataFrame, new_fsrc_df: pl.DataFrame,
         )
         temp_map_df = (
             old_fbnd_df.join(func_map_df, on="old_fid")
-            .join(new_fbnd_df, on=["new_fid", "old_path", "new_path", "code"])
+            .join(new_fbnd_df, on=["new_fid", "old_path", "new_path", "code_key"])
             .filter(pl.col("count") == pl.col("count_right"))
             .select(
                 "old_fid", "old_path", "old_line", 
@@ -665,8 +744,9 @@ def map_src_with_func(old_fsrc_df: pl.DataFrame, new_fsrc_df: pl.DataFrame,
             "code", "code_right",
         )
         .unique()
+        .pipe(filter_similarity, "code", "code_right", 0.9)
         .with_columns(
-            pds.str_leven("code", "code_right", True, True).alias("similarity")
+            levenshtein_similarity_expr("code", "code_right", similarity_cache).alias("similarity")
         )
         .filter(pl.col("similarity") >= 0.9)
         .filter(
@@ -696,7 +776,7 @@ def map_src_with_func(old_fsrc_df: pl.DataFrame, new_fsrc_df: pl.DataFrame,
             on=["new_fid", "new_path"],
         )
         .with_columns(
-            pds.str_leven("old_code", "new_code", True, True).alias("similarity")
+            levenshtein_similarity_expr("old_code", "new_code", similarity_cache).alias("similarity")
         ).filter(
             pl.col("similarity").max().over("old_fid", "old_path", "old_line")
             .eq(pl.col("similarity")) |
@@ -720,7 +800,7 @@ def map_src_with_func(old_fsrc_df: pl.DataFrame, new_fsrc_df: pl.DataFrame,
             fsrc_dfs[1-i].select(pl.all().name.prefix(f"{vers[1-i]}_")),
             on=[f"{vers[1-i]}_fid", f"{vers[1-i]}_path"],
         ).with_columns(
-            pds.str_leven(f"{vers[i]}_code", f"{vers[1-i]}_code", True, True).alias("similarity")
+            levenshtein_similarity_expr(f"{vers[i]}_code", f"{vers[1-i]}_code", similarity_cache).alias("similarity")
         ).filter(
             pl.col("similarity").max().over(f"{vers[i]}_fid", f"{vers[i]}_path", f"{vers[i]}_line")
             .eq(pl.col("similarity"))
@@ -742,7 +822,7 @@ def map_src_with_func(old_fsrc_df: pl.DataFrame, new_fsrc_df: pl.DataFrame,
             .join(fsrc_map_df, on=["new_fid", "new_path", "new_line"], how="anti"),
             on="new_fid",
         ).with_columns(
-            pds.str_leven("old_code", "new_code", True, True).alias("similarity")
+            levenshtein_similarity_expr("old_code", "new_code", similarity_cache).alias("similarity")
         ).filter(
             pl.col("similarity").max().over("old_fid", "old_path", "old_line")
             .eq(pl.col("similarity")) |
@@ -762,7 +842,7 @@ def map_src_with_func(old_fsrc_df: pl.DataFrame, new_fsrc_df: pl.DataFrame,
             fsrc_dfs[1-i].select(pl.all().name.prefix(f"{vers[1-i]}_")),
             on=[f"{vers[1-i]}_fid"],
         ).with_columns(
-            pds.str_leven(f"{vers[i]}_code", f"{vers[1-i]}_code", True, True).alias("similarity")
+            levenshtein_similarity_expr(f"{vers[i]}_code", f"{vers[1-i]}_code", similarity_cache).alias("similarity")
         ).filter(
             pl.col("similarity").max().over(f"{vers[i]}_fid", f"{vers[i]}_path", f"{vers[i]}_line")
             .eq(pl.col("similarity"))
@@ -1,10 +1,128 @@
+import bisect
+import gzip
+import hashlib
+import io
+import json
 import os
-import subprocess
+import queue
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import polars as pl
 import polars_ds as pds
+from elf_reader import is_elf, read_elf_ins
+from cache import evict
 
-def levenshtein_similarity_expr(c1: str | pl.Expr, c2: str | pl.Expr):
-    return pds.str_leven(c1, c2, True, True)
+SIMILARITY_CACHE_MAX_PAIRS = 1 << 24
+SIMILARITY_CACHE_MIN_LEN = 24
+
+class SimilarityCache:
+    # levenshtein distances of the string pairs scored during one wax run, which owns the cache and
+    # passes it to the stages that rescore the same pairs; keyed by the hashes of both strings.
+    # Past max_pairs the oldest pairs are evicted. Short strings are cheaper to rescore than to
+    # look up, so batches below min_len characters on average bypass the cache
+    def __init__(self, max_pairs: int = SIMILARITY_CACHE_MAX_PAIRS,
+                 min_len: int = SIMILARITY_CACHE_MIN_LEN):
+        self.max_pairs = max_pairs
+        self.min_len = min_len
+        self.clear()
+
+    def clear(self):
+        self.distance_df = pl.DataFrame(
+            schema={"key1": pl.UInt64, "key2": pl.UInt64, "distance": pl.UInt32}
+        )
+
+    def bypass(self, s1: pl.Series, s2: pl.Series):
+        return (s1.str.len_chars().mean() or 0) + (s2.str.len_chars().mean() or 0) < 2 * self.min_len
+
+    def distance(self, s1: pl.Series, s2: pl.Series):
+        df = pl.DataFrame([s1.alias("s1"), s2.alias("s2")])
+        if self.bypass(s1, s2):
+            return df.select(pds.str_leven("s1", "s2", True, False).cast(pl.UInt32)).to_series()
+
+        df = df.with_columns(pl.col("s1").hash().alias("key1"), pl.col("s2").hash().alias("key2"))
+        missing_df = (
+            df.drop_nulls()
+            .unique(["key1", "key2"])
+            .join(self.distance_df, on=["key1", "key2"], how="anti")
+        )
+        if not missing_df.is_empty():
+            self.distance_df = pl.concat([
+                self.distance_df,
+                missing_df.select(
+                    "key1", "key2",
+                    pds.str_leven("s1", "s2", True, False).cast(pl.UInt32).alias("distance"),
+                ),
+            ])
+
+        distance = (
+            df.join(self.distance_df, on=["key1", "key2"], how="left", maintain_order="left")
+            .select(
+                pl.when(pl.col("s1").is_not_null() & pl.col("s2").is_not_null())
+                .then(pl.col("distance"))
+            )
+            .to_series()
+        )
+        if len(self.distance_df) > self.max_pairs:
+            self.distance_df = self.distance_df.tail(self.max_pairs).rechunk()
+        return distance
+
+    def similarity(self, s1: pl.Series, s2: pl.Series):
+        if self.bypass(s1, s2):
+            return (
+                pl.DataFrame([s1.alias("s1"), s2.alias("s2")])
+                .select(pds.str_leven("s1", "s2", True, True))
+                .to_series()
+            )
+        max_len = pl.max_horizontal(s1.str.len_chars(), s2.str.len_chars())
+        return (
+            pl.select(
+                pl.when(max_len == 0).then(1.0)
+                .otherwise(1 - self.distance(s1, s2) / max_len)
+            )
+            .to_series()
+        )
+
+def levenshtein_distance_expr(c1: str | pl.Expr, c2: str | pl.Expr, cache: SimilarityCache | None = None):
+    if cache is None:
+        return pds.str_leven(c1, c2, True, False).cast(pl.UInt32)
+    return pl.struct(s1=c1, s2=c2).map_batches(
+        lambda s: cache.distance(s.struct.field("s1"), s.struct.field("s2")),
+        return_dtype=pl.UInt32, is_elementwise=True,
+    )
+
+def levenshtein_similarity_expr(c1: str | pl.Expr, c2: str | pl.Expr, cache: SimilarityCache | None = None):
+    if cache is None:
+        return pds.str_leven(c1, c2, True, True)
+    return pl.struct(s1=c1, s2=c2).map_batches(
+        lambda s: cache.similarity(s.struct.field("s1"), s.struct.field("s2")),
+        return_dtype=pl.Float64, is_elementwise=True,
+    )
+
+def levenshtein_similarity_bound_expr(c1: str | pl.Expr, c2: str | pl.Expr):
+    # upper bound of levenshtein_similarity_expr: the distance is never below the length difference
+    len1 = (pl.col(c1) if isinstance(c1, str) else c1).str.len_chars()
+    len2 = (pl.col(c2) if isinstance(c2, str) else c2).str.len_chars()
+    return (
+        pl.when(pl.max_horizontal(len1, len2) == 0).then(1.0)
+        .otherwise(pl.min_horizontal(len1, len2) / pl.max_horizontal(len1, len2))
+    )
+
+def filter_similarity(df: pl.DataFrame, c1: str, c2: str, threshold: float):
+    # keeps a superset of the rows whose levenshtein_similarity_expr reaches threshold: pairs too far
+    # apart in length are dropped outright, the rest by a bounded distance check that gives up once the
+    # distance budget of their length is spent
+    max_len = pl.max_horizontal(pl.col(c1).str.len_chars(), pl.col(c2).str.len_chars())
+    df = (
+        df.filter(levenshtein_similarity_bound_expr(c1, c2) >= threshold - 1e-9)
+        .with_columns(((1 - threshold) * max_len + 1e-9).floor().cast(pl.UInt32).alias("_budget"))
+    )
+    if df.is_empty():
+        return df.drop("_budget")
+    return pl.concat(
+        budget_df.filter(pds.filter_by_levenshtein(c1, c2, budget, True))
+        for (budget,), budget_df in df.partition_by("_budget", as_dict=True).items()
+    ).drop("_budget")
 
 def read_yaml_func(yaml_path):
     return (
@@ -20,22 +138,101 @@ def read_yaml_func(yaml_path):
         )
     )
 
-def read_paths(src_paths):
+PATH_WALK_WORKERS = 32
+
+def list_dir(path: str, index: dict):
+    try:
+        stat = os.stat(path)
+        listing = index.get(path)
+        if listing is not None and listing[0] == stat.st_mtime_ns:
+            return listing
+        files, dirs = [], []
+        with os.scandir(path) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir():
+                        dirs.append(entry.name)
+                    elif entry.is_file():
+                        files.append(entry.name)
+                except OSError:
+                    pass
+    except OSError:
+        return None
+    return [stat.st_mtime_ns, stat.st_dev, stat.st_ino, files, dirs]
+
+def walk_paths(root: str, previous: dict):
+    # same files as `find -L root -type f`; directories whose mtime is unchanged reuse their listing.
+    # the returned index holds only the directories visited, so removed ones drop out
+    index: dict = {}
+    if os.path.isfile(root):
+        return [root], index
+    paths: list[str] = []
+    frontier = [(root, frozenset())]
+    with ThreadPoolExecutor(PATH_WALK_WORKERS) as pool:
+        while frontier:
+            next_frontier = []
+            for (path, ancestors), listing in zip(
+                frontier, pool.map(lambda item: list_dir(item[0], previous), frontier)
+            ):
+                if listing is None:
+                    continue
+                index[path] = listing
+                mtime, dev, ino, files, dirs = listing
+                if (dev, ino) in ancestors:
+                    continue
+                paths.extend(os.path.join(path, name) for name in files)
+                next_frontier.extend(
+                    (os.path.join(path, name), ancestors | {(dev, ino)}) for name in dirs
+                )
+            frontier = next_frontier
+    return paths, index
+
+def read_paths(src_paths, cache_dir: str | None = None):
+    # one index per root, evicted with the cache entries once unused
+    paths: list[str] = []
+    for root in dict.fromkeys(src_paths):
+        index_path = None
+        previous = {}
+        if cache_dir:
+            key = hashlib.blake2b(os.path.abspath(root).encode(), digest_size=16).hexdigest()
+            index_path = os.path.join(cache_dir, f"paths-{key}.json")
+            if os.path.exists(index_path):
+                with open(index_path) as f:
+                    previous = json.load(f)
+
+        root_paths, index = walk_paths(root, previous)
+        paths.extend(root_paths)
+
+        if index_path:
+            os.makedirs(cache_dir, exist_ok=True)
+            with open(index_path + ".tmp", "w") as f:
+                json.dump(index, f)
+            os.replace(index_path + ".tmp", index_path)
+    if cache_dir:
+        evict(cache_dir)
+    return pl.DataFrame({"path": paths}, schema={"path": pl.String})
+
+def read_log_lines(log_path: str):
     return (
-        pl.from_dict({
-            "column_1": subprocess.Popen(
-                rf'find -L {" ".join(src_paths)} -type f', 
-                text=True, 
-                shell=True, 
-                stdout=subprocess.PIPE,
-            ).stdout
-        })
-        .select(pl.col("column_1").str.replace("\n", "").alias("path"))
+        pl.scan_csv(log_path, separator="?", has_header=False)
+        .filter(
+            pl.col("column_1").str.starts_with("Tawhid-Counts:") |
+            pl.col("column_1").str.starts_with("Tawhid-LineInfo")
+        )
+        .collect(engine="streaming")
     )
 
-def read_func_info(log_path: str):
+def read_log(log_path: str):
+    # scan the log once and split the kept lines into all four tables
+    log_df = read_log_lines(log_path)
+    func_df, node_df, edge_df = read_cfgs(log_df)
+    return func_df, node_df, edge_df, read_func_info(log_df)
+
+def read_func_info(log: str | pl.DataFrame):
+    if isinstance(log, str):
+        log = read_log_lines(log)
     df = (
-        pl.read_csv(log_path, separator="?", has_header=False)
+        log
         .filter(pl.col("column_1").str.starts_with("Tawhid-LineInfo"))
         .with_columns(
             pl.col("column_1")
@@ -71,9 +268,11 @@ def read_func_info(log_path: str):
         )
     )
 
-def read_cfgs(file):
+def read_cfgs(log: str | pl.DataFrame):
+    if isinstance(log, str):
+        log = read_log_lines(log)
     df = (
-        pl.read_csv(file, separator="?", has_header=False)
+        log
         .filter(pl.col("column_1").str.starts_with("Tawhid-Counts:"))
         .with_columns(
             pl.col("column_1")
@@ -147,77 +346,163 @@ def read_cfgs(file):
 
     return func_df, node_df, edge_df
 
-def read_srcs(paths):
-    src_dfs: list[pl.DataFrame] = []
-
-    for path in paths:
-        with open(path) as f:
-            src_dfs.append(
-                pl.from_dict({"code": f.readlines()})
-                .with_columns(pl.lit(path).alias("path"))
-                .with_row_index(name="line", offset=1)
-            )
-    return (
-        pl.concat(src_dfs)
-        .with_columns(
-            pl.format("{} //{}",
-                pl.col("code").str.strip_chars_end(), "line"
-            )
-        )
-        .group_by("path")
-        .agg(pl.col("code").str.join("\n"))
-        .with_columns(
-            pl.col("code").str.replace_all(r"(?s)/\*.*?\*/", "")
-            .str.split("\n")
+SRC_READ_WORKERS = 32
+BLOCK_COMMENT_RE = re.compile(r"/\*.*?\*/", re.S)
+
+def normalize_src(data: bytes):
+    # decode the way open() in text mode would, including universal newlines
+    lines = io.TextIOWrapper(io.BytesIO(data)).read().split("\n")
+    if lines[-1] == "":
+        lines.pop()
+    lines = [line.rstrip() for line in lines]
+
+    if any("/*" in line for line in lines):
+        # drop /* */ comments; a line joined across a comment keeps the number of its last line
+        text = "\n".join(lines)
+        lines, line_numbers = [], []
+        pending, line, pos = "", 1, 0
+        for match in [*BLOCK_COMMENT_RE.finditer(text), None]:
+            *ended, pending_tail = text[pos:match.start() if match else len(text)].split("\n")
+            for segment in ended:
+                lines.append(pending + segment)
+                line_numbers.append(line)
+                pending = ""
+                line += 1
+            pending += pending_tail
+            if match:
+                line += match.group().count("\n")
+                pos = match.end()
+        lines.append(pending)
+        line_numbers.append(line)
+    else:
+        line_numbers = range(1, len(lines) + 1)
+
+    kept = [i for i, code in enumerate(lines) if code.strip(" \t")]
+    return [lines[i] for i in kept], [line_numbers[i] for i in kept]
+
+def with_src_keys(src_df: pl.DataFrame):
+    # both forms of a line the matching stages compare, hashed once so their joins run on integers
+    return src_df.with_columns(
+        pl.col("code").hash().alias("code_key"),
+        pl.col("code").str.replace(r"//.*$", "").hash().alias("bare_key"),
+    )
+
+def read_src_pack(*path_lists):
+    # each distinct file content is read and normalized once, however many paths share it; content
+    # ids are digests of the bytes, so packs read separately (or cached by another run) agree on them
+    contents: set[int] = set()
+    lock = threading.Lock()
+
+    def load(path: str):
+        with open(path, "rb") as f:
+            data = f.read()
+        content = int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "little")
+        with lock:
+            is_new = content not in contents
+            contents.add(content)
+        return content, normalize_src(data) if is_new else None
+
+    paths = list(dict.fromkeys(path for path_list in path_lists for path in path_list))
+    with ThreadPoolExecutor(SRC_READ_WORKERS) as pool:
+        loaded = list(pool.map(load, paths))
+
+    srcs = [(content, src) for content, src in loaded if src is not None]
+    content_df = (
+        pl.DataFrame(
+            {
+                "content": [content for content, _ in srcs],
+                "code": [codes for _, (codes, _) in srcs],
+                "line": [line_numbers for _, (_, line_numbers) in srcs],
+            },
+            schema={"content": pl.UInt64, "code": pl.List(pl.String), "line": pl.List(pl.Int64)},
         )
-        .explode("code")
-        .filter(~pl.col("code").str.contains(r"^[ \t]+//\d+$"))
-        .with_columns(
-            pl.col("code").str.extract_groups(r"^(?<code>.*) //(?<line>\d+)$")
-            .struct.unnest()
+        .explode("code", "line")
+        .drop_nulls("line")
+        .sort("content", "line")
+    )
+    path_content = dict(zip(paths, (content for content, _ in loaded)))
+    return content_df, *(
+        pl.DataFrame(
+            {"path": list(path_list), "content": [path_content[path] for path in path_list]},
+            schema={"path": pl.String, "content": pl.UInt64},
         )
-        .with_columns(pl.col("line").cast(int))
+        for path_list in path_lists
     )
 
-def read_ins(debug_path: str, node_df: pl.LazyFrame):
-    debug_df = (
-        pl.scan_csv(debug_path, separator="?", has_header=False)
-        .with_row_index()
+def read_srcs(paths):
+    content_df, path_df = read_src_pack(list(paths))
+    return with_src_keys(path_df.join(content_df, on="content").drop("content"))
+
+def open_debug_stream(debug_path: str):
+    if debug_path.endswith(".gz"):
+        return gzip.open(debug_path, "rb")
+    if debug_path.endswith(".zst"):
+        try:
+            import zstandard
+        except ImportError as e:
+            raise ImportError("reading .zst objdump files requires the zstandard package") from e
+        return zstandard.ZstdDecompressor().stream_reader(open(debug_path, "rb"), closefd=True)
+    return open(debug_path, "rb")
+
+def read_line_batches(debug_path: str, batch_size: int = 1 << 26, prefetch: int = 2):
+    # decompress on a background thread; each batch ends on a line boundary
+    batches: queue.Queue = queue.Queue(maxsize=prefetch)
+    # set when the consumer stops early, so the thread closes the file instead of blocking on put
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                batches.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def decompress():
+        try:
+            with open_debug_stream(debug_path) as f:
+                rest = b""
+                while chunk := f.read(batch_size):
+                    chunk = rest + chunk
+                    end = chunk.rfind(b"\n") + 1
+                    if end and not put(chunk[:end]):
+                        return
+                    rest = chunk[end:]
+                if rest and not put(rest):
+                    return
+            put(None)
+        except BaseException as e:
+            put(e)
+
+    thread = threading.Thread(target=decompress, daemon=True)
+    thread.start()
+    try:
+        while (batch := batches.get()) is not None:
+            if isinstance(batch, BaseException):
+                raise batch
+            yield batch
+    finally:
+        stop.set()
+        thread.join()
+
+def normalize_debug_file_expr(c: str | pl.Expr):
+    return (
+        (pl.col(c) if isinstance(c, str) else c)
+        .str.replace_all(r"/(\./)+", "/")
+        .str.replace(r"^\./", "")
+        .str.replace(r"obj/", "", literal=True)
+        .str.replace(r".*/\.\./", "")
     )
 
+# columns of read_ins
+INS_COLUMNS = ["fid", "bid", "file", "line", "address", "opcode", "operand", "jump_name", "jump_offset"]
+
+def select_block_ins(ins_df: pl.DataFrame, node_df: pl.DataFrame):
     return (
-        (
-            debug_df.filter(pl.col("column_1").str.starts_with(" "))
-            .with_columns(
-                pl.col("column_1")
-                .str.strip_chars()
-                .str.splitn(":", 2)
-                .struct.rename_fields(["address", "instruction"])
-            )
-            .unnest("column_1")
-            .with_columns(pl.col("instruction").str.strip_chars())
-            .filter(pl.col("instruction").is_not_null())
-        )
-        .join_asof(
-            debug_df.filter(pl.col("column_1").str.starts_with(";"))
-            .with_columns(
-                pl.col("column_1")
-                .str.replace(r"^;\s", "")
-                .str.replace_all(r"/(\./)+", "/")
-                .str.replace(r"^\./", "")
-                .str.replace(r"obj/", "", literal=True)
-                .str.replace(r".*/\.\./", "")
-                .str.splitn(":", 2)
-                .struct.rename_fields(["file", "line"])
-            )
-            .unnest("column_1")
-            .with_columns(pl.col("line").cast(int, strict=False))
-            .filter(pl.col("line").is_not_null()),
-            on="index",
-        )
-        .with_columns(pl.col("address").str.to_integer(base=16))
+        ins_df
         .join_asof(
-            node_df.sort("start_address"), 
+            node_df, 
             left_on="address", 
             right_on="start_address",
         )
@@ -230,5 +515,151 @@ def read_ins(debug_path: str, node_df: pl.LazyFrame):
             pl.col("file").is_not_null() &
             pl.col("line").is_not_null()
         )
-        .select("fid", "bid", "file", "line", "address", "instruction")
+        # operands are parsed once here: absolute target addresses dropped, direct targets split out
+        .with_columns(
+            pl.col("instruction")
+            .str.splitn("\t", 2)
+            .struct.rename_fields(["opcode", "operand"])
+        )
+        .unnest("instruction")
+        .with_columns(
+            pl.col("operand")
+            .str.replace(r"0x[0-9a-f]+\s<", "<")
+            .fill_null("")
+        )
+        .with_columns(
+            pl.col("operand")
+            .str.extract_groups(r"<(.+)\+0x([0-9a-f]+)>")
+            .struct.rename_fields(["jump_name", "jump_offset"])
+            .alias("jump")
+        )
+        .unnest("jump")
+        .with_columns(pl.col("jump_offset").str.to_integer(base=16))
+        .select(INS_COLUMNS)
     )
+
+def with_jump_fid(ins_df: pl.DataFrame, func_df: pl.DataFrame):
+    # direct jump targets resolved to functions; names shared by several functions stay unresolved
+    return ins_df.join(
+        func_df
+        .select(pl.col("func").alias("jump_name"), pl.col("fid").alias("jump_fid"))
+        .unique("jump_name", keep="none"),
+        on="jump_name", how="left",
+    )
+
+# function symbol lines of objdump, found by their preceding newline (much faster than ^ with re.M)
+FUNC_HEADER_RE = re.compile(rb"\n([0-9a-f]+) <[^\n]*>:$", re.M)
+LINE_MARKER_RE = re.compile(rb";\s[^\n]*:\d+\n?")
+
+def select_func_regions(batch: bytes, block_starts: list[int], block_ends: list[int], keep: bool):
+    # drops the bytes of functions without any block before they are parsed; a dropped span
+    # keeps its last file:line marker so the instructions after it still inherit the same line
+    def kept(span: bytes, keep: bool):
+        if keep:
+            return span
+        # walk back over comment lines, skipping function name lines such as "; f():"
+        end = len(span)
+        while True:
+            j = span.rfind(b"\n;", 0, end) + 1
+            if not j and not span.startswith(b";"):
+                return b""
+            line = span[j:span.find(b"\n", j) + 1 or len(span)]
+            if LINE_MARKER_RE.fullmatch(line):
+                return line
+            if not j:
+                return b""
+            end = j - 1
+
+    headers = list(FUNC_HEADER_RE.finditer(b"\n" + batch))
+    addresses = [int(m[1], 16) for m in headers]
+    parts, pos = [], 0
+    for i, m in enumerate(headers):
+        # offsets in the prefixed batch are one past the newline, i.e. at the header line
+        parts.append(kept(batch[pos:m.start()], keep))
+        # a function running past the batch end is kept whole
+        end = addresses[i + 1] if i + 1 < len(addresses) else float("inf")
+        k = bisect.bisect_left(block_starts, end)
+        keep = k > 0 and block_ends[k - 1] > addresses[i]
+        pos = m.start()
+    parts.append(kept(batch[pos:], keep))
+    return b"".join(parts), keep
+
+def read_ins(debug_path: str, node_df: pl.LazyFrame | pl.DataFrame, batch_size: int = 1 << 26):
+    node_df = node_df.lazy().sort("start_address").collect()
+
+    # a binary is read directly: line table from .debug_line, instructions only for block ranges
+    if is_elf(debug_path):
+        return select_block_ins(
+            read_elf_ins(debug_path, node_df)
+            .with_columns(normalize_debug_file_expr("file")),
+            node_df,
+        )
+
+    # block ranges by start, with the furthest end reached so far for the interval test
+    block_starts = node_df["start_address"].to_list()
+    block_ends = node_df["end_address"].cum_max().to_list()
+    keep = True
+
+    ins_dfs: list[pl.DataFrame] = []
+    prev_line_df = None
+    offset = 0
+    batches = read_line_batches(debug_path, batch_size)
+    try:
+        for batch in batches:
+            batch, keep = select_func_regions(batch, block_starts, block_ends, keep)
+            if not batch:
+                continue
+            debug_df = (
+                pl.read_csv(
+                    batch, separator="?", has_header=False, 
+                    schema={"column_1": pl.String}, truncate_ragged_lines=True,
+                )
+                .with_row_index()
+                .with_columns(pl.col("index").cast(pl.UInt64) + offset)
+            )
+            offset += debug_df.height
+
+            line_df = (
+                debug_df.filter(pl.col("column_1").str.starts_with(";"))
+                .with_columns(
+                    normalize_debug_file_expr(pl.col("column_1").str.replace(r"^;\s", ""))
+                    .str.splitn(":", 2)
+                    .struct.rename_fields(["file", "line"])
+                )
+                .unnest("column_1")
+                .with_columns(pl.col("line").cast(int, strict=False))
+                .filter(pl.col("line").is_not_null())
+            )
+            # instructions at the start of a batch belong to the last line of the previous one
+            if prev_line_df is not None:
+                line_df = pl.concat([prev_line_df, line_df])
+            if not line_df.is_empty():
+                prev_line_df = line_df.tail(1)
+
+            ins_dfs.append(select_block_ins(
+                debug_df.filter(pl.col("column_1").str.starts_with(" "))
+                .with_columns(
+                    pl.col("column_1")
+                    .str.strip_chars()
+                    .str.splitn(":", 2)
+                    .struct.rename_fields(["address", "instruction"])
+                )
+                .unnest("column_1")
+                .with_columns(pl.col("instruction").str.strip_chars())
+                .filter(pl.col("instruction").is_not_null())
+                .join_asof(line_df, on="index")
+                .with_columns(pl.col("address").str.to_integer(base=16)),
+                node_df,
+            ))
+    finally:
+        # a parse error must not leave the decompression thread blocked with the file open
+        batches.close()
+
+    if not ins_dfs:
+        # an empty objdump, or none of its functions holds a block of the node set
+        return pl.DataFrame(schema={
+            "fid": node_df.schema["fid"], "bid": node_df.schema["bid"],
+            "file": pl.String, "line": pl.Int64, "address": pl.Int64, "opcode": pl.String,
+            "operand": pl.String, "jump_name": pl.String, "jump_offset": pl.Int64,
+        })
+    return pl.concat(ins_dfs)
@@ -1,49 +1,90 @@
 import polars as pl
 import polars.selectors as cs
-import polars_ds as pds
 import sys
-from path_mapper import replace_with_path, map_path_by_name
+from path_mapper import PathResolver, replace_with_path, map_path_by_name
 from function_mapper import map_func_by_debug
+from assignment import assign_pairs
 from source_mapper import map_src, map_src_with_func
 from instruction_mapper import map_ins
-from basicblock_mapper import map_bb
+from basicblock_mapper import map_bb, select_hot_blocks, report_coverage
+from cache import cached, load_cached, digest_files, digest_frame
 from utils import (
-    read_yaml_func, read_paths, read_func_info, read_cfgs, read_srcs, read_ins, 
-    levenshtein_similarity_expr
+    read_yaml_func, read_paths, read_log, read_src_pack, with_src_keys, read_ins, 
+    with_jump_fid, 
+    levenshtein_similarity_expr, levenshtein_distance_expr, SimilarityCache
 )
 
 def wax(old_log_path, new_log_path, 
         old_src_path, new_src_path, 
         old_debug_path, new_debug_path, 
         common_paths, yaml_in_path,
-        func_map_out_path, bb_map_out_path, bb_cross_out_path, map_all_src=False):
-    old_func_df, old_node_df, old_edge_df = read_cfgs(old_log_path)
+        func_map_out_path, bb_map_out_path, bb_cross_out_path, map_all_src=False,
+        cache_dir=None, map_hot_only=False):
+    # string pairs are scored once per run, whichever stage asks first
+    similarity_cache = SimilarityCache()
+    old_func_df, old_node_df, old_edge_df, old_line_info_df = cached(
+        cache_dir, "log", lambda: digest_files([old_log_path], cache_dir),
+        lambda: read_log(old_log_path),
+    )
     old_yaml_func_df = read_yaml_func(yaml_in_path).join(old_func_df, on="func")
     
-    old_path_df = read_paths([old_src_path, *common_paths])
+    # headers shared by both versions are indexed once
+    common_path_df = read_paths(common_paths, cache_dir)
+    # raw debug paths are resolved once per version and reused by every table below
+    old_path_resolver = PathResolver(
+        pl.concat([read_paths([old_src_path], cache_dir), common_path_df])
+    )
     old_func_info_df = replace_with_path(
-        read_func_info(old_log_path), "file", old_path_df
+        old_line_info_df, "file", old_path_resolver
     ).drop("fid").join(old_func_df, on="func")
     if map_all_src:
         old_node_select_df = old_node_df
     else:
         old_node_select_df = old_node_df.join(old_yaml_func_df.select("fid"), on="fid")
-    old_ins_df = replace_with_path(
-        read_ins(old_debug_path, old_node_select_df.lazy()).collect(), 
-        "file", old_path_df
+    # the new side caches every block, so the previous release's entry for this binary is reused;
+    # without one, only the regions of the selected functions are parsed
+    old_ins_df = load_cached(
+        cache_dir, "ins",
+        lambda: [*digest_files([old_debug_path], cache_dir), digest_frame(old_node_df)],
+    )
+    if old_ins_df is None:
+        old_ins_df = cached(
+            cache_dir, "ins",
+            lambda: [*digest_files([old_debug_path], cache_dir), digest_frame(old_node_select_df)],
+            lambda: read_ins(old_debug_path, old_node_select_df.lazy()),
+        )
+    elif not map_all_src:
+        old_ins_df = old_ins_df.join(old_yaml_func_df, on="fid", how="semi")
+    old_ins_df = with_jump_fid(
+        replace_with_path(old_ins_df, "file", old_path_resolver),
+        old_func_df,
     )
 
-    new_func_df, new_node_df, new_edge_df = read_cfgs(new_log_path)
-    new_path_df = read_paths([new_src_path, *common_paths])
+    new_func_df, new_node_df, new_edge_df, new_line_info_df = cached(
+        cache_dir, "log", lambda: digest_files([new_log_path], cache_dir),
+        lambda: read_log(new_log_path),
+    )
+    new_path_resolver = PathResolver(
+        pl.concat([read_paths([new_src_path], cache_dir), common_path_df])
+    )
     new_func_info_df = replace_with_path(
-        read_func_info(new_log_path), "file", new_path_df
+        new_line_info_df, "file", new_path_resolver
     ).drop("fid").join(new_func_df, on="func")
-    new_ins_df = replace_with_path(
-        read_ins(new_debug_path, new_node_df.lazy()).collect(), 
-        "file", new_path_df
+    new_ins_df = with_jump_fid(
+        replace_with_path(
+            cached(
+                cache_dir, "ins",
+                lambda: [*digest_files([new_debug_path], cache_dir), digest_frame(new_node_df)],
+                lambda: read_ins(new_debug_path, new_node_df.lazy()),
+            ),
+            "file", new_path_resolver
+        ),
+        new_func_df,
     )
 
-    func_map_df = map_func_by_debug(old_func_info_df, new_func_info_df, old_yaml_func_df)
+    func_map_df = map_func_by_debug(
+        old_func_info_df, new_func_info_df, old_yaml_func_df, similarity_cache=similarity_cache
+    )
 
     if not map_all_src:
         new_ins_df = new_ins_df.join(
@@ -61,27 +102,48 @@ def wax(old_log_path, new_log_path,
             on="fid",
         )
 
-    old_src_df = read_srcs(old_ins_df["path"].unique())
-    new_src_df = read_srcs(new_ins_df["path"].unique())
+    old_src_paths = old_ins_df["path"].unique().sort().to_list()
+    new_src_paths = new_ins_df["path"].unique().sort().to_list()
+    # sources are cached per version so the new side is reused as the next release's old side;
+    # identical files are read and keyed once via content ids, but each version keeps its own lines
+    old_content_df, old_src_path_df = cached(
+        cache_dir, "srcs",
+        lambda: [*old_src_paths, *digest_files(old_src_paths, cache_dir)],
+        lambda: read_src_pack(old_src_paths),
+    )
+    new_content_df, new_src_path_df = cached(
+        cache_dir, "srcs",
+        lambda: [*new_src_paths, *digest_files(new_src_paths, cache_dir)],
+        lambda: read_src_pack(new_src_paths),
+    )
+    src_content_df = pl.concat([
+        old_content_df,
+        new_content_df.join(old_content_df.select("content").unique(), on="content", how="anti"),
+    ])
+    src_content_df = with_src_keys(src_content_df)
+    old_src_df = old_src_path_df.join(src_content_df, on="content").drop("content")
+    new_src_df = new_src_path_df.join(src_content_df, on="content").drop("content")
 
     src_map_df = map_src(old_src_df, new_src_df, 
                          old_ins_df.select("path", "line").unique(), 
-                         new_ins_df.select("path", "line").unique())
+                         new_ins_df.select("path", "line").unique(),
+                         old_src_path_df, new_src_path_df)
 
-    temp_match_df = (
-        src_map_df.join(
-            old_ins_df.select(cs.by_name("fid", "path", "line").name.prefix("old_")).unique()
-            .join(func_map_df, on="old_fid", how="anti"),
+    # old x new function scores over every function, shared by the unmapped and multi-map passes
+    func_score_df = (
+        src_map_df
+        .join(
+            old_ins_df.select(cs.by_name("fid", "path", "line").name.prefix("old_")).unique(), 
             on=["old_path", "old_line"],
-        ).join(
-            new_ins_df.select(cs.by_name("fid", "path", "line").name.prefix("new_")).unique()
-            .join(func_map_df, on="new_fid", how="anti"),
+        )
+        .join(
+            new_ins_df.select(cs.by_name("fid", "path", "line").name.prefix("new_")).unique(), 
             on=["new_path", "new_line"],
         )
-        .join(old_src_df, left_on=["old_path", "old_line"], right_on=["path", "line"])
-        .join(new_src_df, left_on=["new_path", "new_line"], right_on=["path", "line"])
+        .join(old_src_df.select("path", "line", "code"), left_on=["old_path", "old_line"], right_on=["path", "line"])
+        .join(new_src_df.select("path", "line", "code"), left_on=["new_path", "new_line"], right_on=["path", "line"])
         .with_columns(
-            pds.str_leven("code", "code_right", True, False).alias("distance")
+            levenshtein_distance_expr("code", "code_right", similarity_cache).alias("distance")
         )
         .with_columns(
             lcs=(pl.col("code").str.len_chars() + 
@@ -92,24 +154,18 @@ def wax(old_log_path, new_log_path,
         .agg(pl.sum("lcs").alias("score"))
     )
 
-    temp_map_dfs: list[pl.DataFrame] = []
-    while True:
-        temp_map_df = (
-            temp_match_df
-            .filter(
-                pl.col("score").max().over("old_fid").eq(pl.col("score")) &
-                pl.col("score").max().over("new_fid").eq(pl.col("score"))
-            )
-            .filter(pl.col("old_fid").is_unique() & pl.col("new_fid").is_unique())
-        )
-        temp_map_dfs.append(temp_map_df)
-        if temp_map_df.is_empty():
-            break
-        temp_match_df = (
-            temp_match_df
-            .join(temp_map_df, on="old_fid", how="anti")
-            .join(temp_map_df, on="new_fid", how="anti")
-        )
+    temp_match_df = (
+        func_score_df
+        .join(func_map_df, on="old_fid", how="anti")
+        .join(func_map_df, on="new_fid", how="anti")
+    )
+
+    temp_map_dfs: list[pl.DataFrame] = [assign_pairs(temp_match_df, "score")]
+    temp_match_df = (
+        temp_match_df
+        .join(temp_map_dfs[0], on="old_fid", how="anti")
+        .join(temp_map_dfs[0], on="new_fid", how="anti")
+    )
 
     while True:
         temp_map_df = (
@@ -124,12 +180,12 @@ def wax(old_log_path, new_log_path,
             .with_columns(
                 pl.struct(
                     funcname=(
-                        levenshtein_similarity_expr("old_namespace", "new_namespace") +
-                        levenshtein_similarity_expr("old_basename", "new_basename")
+                        levenshtein_similarity_expr("old_namespace", "new_namespace", similarity_cache) +
+                        levenshtein_similarity_expr("old_basename", "new_basename", similarity_cache)
                     ),
-                    parameters=levenshtein_similarity_expr("old_parameters", "new_parameters"),
-                    extension=levenshtein_similarity_expr("old_extension", "new_extension"),
-                    chunk=levenshtein_similarity_expr("old_chunk", "new_chunk"),
+                    parameters=levenshtein_similarity_expr("old_parameters", "new_parameters", similarity_cache),
+                    extension=levenshtein_similarity_expr("old_extension", "new_extension", similarity_cache),
+                    chunk=levenshtein_similarity_expr("old_chunk", "new_chunk", similarity_cache),
                     len=-1*(pl.col("old_func").str.len_chars().cast(int) - 
                             pl.col("new_func").str.len_chars()).abs()
                 ).alias("similarity")
@@ -167,27 +223,7 @@ def wax(old_log_path, new_log_path,
 
     multi_func_map_df = func_map_df.vstack(
         pl.concat(
-            src_map_df
-            .join(
-                old_ins_df.select(cs.by_name("fid", "path", "line").name.prefix("old_")).unique(), 
-                on=["old_path", "old_line"],
-            )
-            .join(
-                new_ins_df.select(cs.by_name("fid", "path", "line").name.prefix("new_")).unique(), 
-                on=["new_path", "new_line"],
-            )
-            .join(old_src_df, left_on=["old_path", "old_line"], right_on=["path", "line"])
-            .join(new_src_df, left_on=["new_path", "new_line"], right_on=["path", "line"])
-            .with_columns(
-                pds.str_leven("code", "code_right", True, False).alias("distance")
-            )
-            .with_columns(
-                lcs=(pl.col("code").str.len_chars() + 
-                     pl.col("code_right").str.len_chars() - 
-                     pl.col("distance")) // 2
-            )
-            .group_by("old_fid", "new_fid")
-            .agg(pl.sum("lcs").alias("score"))
+            func_score_df
             .join(
                 func_map_df.with_columns(pl.lit(True).alias("has_map")), 
                 on=["old_fid", "new_fid"], how="left",
@@ -225,10 +261,16 @@ def wax(old_log_path, new_log_path,
     fsrc_map_df = map_src_with_func(
         old_ins_df.select("fid", "path", "line").unique().join(old_src_df, on=["path", "line"]),
         new_ins_df.select("fid", "path", "line").unique().join(new_src_df, on=["path", "line"]),
-        multi_func_map_df, src_map_df, map_remaining=True
+        multi_func_map_df, src_map_df, map_remaining=True, similarity_cache=similarity_cache
     )
-    ins_map_df = map_ins(old_ins_df, new_ins_df, fsrc_map_df)
-    bb_map_df = map_bb(old_node_df, new_node_df, old_edge_df, new_edge_df, ins_map_df, func_map_df)
+    old_ins_map_df, old_node_map_df = old_ins_df, old_node_df
+    if map_hot_only:
+        # blocks without samples add nothing to the rewritten profile
+        hot_block_df = select_hot_blocks(old_node_select_df, old_edge_df)
+        old_ins_map_df = old_ins_df.join(hot_block_df, on=["fid", "bid"], how="semi")
+        old_node_map_df = old_node_df.join(hot_block_df, on=["fid", "bid"], how="semi")
+    ins_map_df = map_ins(old_ins_map_df, new_ins_df, fsrc_map_df, func_map_df)
+    bb_map_df = map_bb(old_node_map_df, new_node_df, old_edge_df, new_edge_df, ins_map_df, func_map_df)
 
     updated_func_map_df = (
         bb_map_df.group_by("old_fid", "new_fid").len()
@@ -245,7 +287,7 @@ def wax(old_log_path, new_log_path,
         .join(func_map_df.select("old_fid", "old_func"), on="old_fid")
         .join(new_func_df.rename(lambda col: "new_" + col), on="new_fid", how="left")
         .with_columns(
-            pds.str_leven("old_func", "new_func", True, True).alias("similarity")
+            levenshtein_similarity_expr("old_func", "new_func", similarity_cache).alias("similarity")
         )
         .filter(pl.col("similarity").max().over("old_fid").eq(pl.col("similarity")))
         .sort("new_func")
@@ -265,6 +307,11 @@ def wax(old_log_path, new_log_path,
         .write_csv(func_map_out_path, include_header=False)
     )
 
+    if map_hot_only:
+        report_coverage(
+            old_node_select_df, bb_map_df.join(updated_func_map_df, on=["old_fid", "new_fid"])
+        )
+
     (
         bb_map_df.join(updated_func_map_df, on=["old_fid", "new_fid"])
         .select(
@@ -297,9 +344,12 @@ if __name__ == "__main__":
     bb_map_out_path = sys.argv[9]
     bb_cross_out_path = sys.argv[10]
     map_all_src = (len(sys.argv) > 11 and sys.argv[11] == 'y')
+    cache_dir = sys.argv[12] if len(sys.argv) > 12 and sys.argv[12] else None
+    map_hot_only = (len(sys.argv) > 13 and sys.argv[13] == 'y')
 
     wax(old_log_path, new_log_path, 
         old_src_path, new_src_path, 
         old_debug_path, new_debug_path, 
         common_paths, yaml_in_path,
-        func_map_out_path, bb_map_out_path, bb_cross_out_path, map_all_src)
+        func_map_out_path, bb_map_out_path, bb_cross_out_path, map_all_src,
+        cache_dir, map_hot_only)